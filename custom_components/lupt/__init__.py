@@ -2,32 +2,54 @@
 import asyncio
 from datetime import timedelta
 import logging
+import time
 
 from homeassistant import core
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import callback
+from homeassistant.exceptions import ConfigEntryNotReady
 from homeassistant.helpers import event
+from homeassistant.helpers.dispatcher import async_dispatcher_send
 from homeassistant.helpers.entity import Entity
 from homeassistant.util import dt as dt_util
 from london_unified_prayer_times import (
     cache as lupt_cache,
     config as lupt_config,
     constants as lupt_constants,
-    query as lupt_query,
     report as lupt_report,
 )
 
+from . import perf, refresh, remote, snapshot
+from .breaker import CircuitOpenError, FetchBreaker
 from .const import (
+    ARCHIVE_HISTORY,
     ASR_MITHL_1_LABEL,
     ASR_MITHL_2_LABEL,
+    BREAKER_KEY,
     CACHED_KEY,
+    COMMITTED_TICKET_KEY,
+    DEFAULT_REFRESH_MAX_DAYS,
+    DEFAULT_REFRESH_MIN_DAYS,
+    DEFAULT_REFRESH_WINDOW_MINS,
+    DEFAULT_RETENTION_DAYS,
     DOMAIN,
     DUHA_STATE_LABEL,
     ENTITY_ID,
+    FETCH_KEY,
+    FETCHED_KEY,
     HASS_TIMETABLE,
+    INDEX_KEY,
     ISLAMIC_DATE_STRATEGY,
+    LOCAL_TICKET,
     MAGHRIB_TIME_LABEL,
     NAME,
+    PERFORMANCE_SENSOR,
+    REFRESH_MAX_DAYS,
+    REFRESH_MIN_DAYS,
+    REFRESH_WINDOW_MINS,
+    RETENTION_DAYS,
+    SIGNAL_TIMETABLE_UPDATED,
+    SIGNAL_UPDATE,
     STATE_ATTR_ISLAMIC_DATE,
     STATE_ATTR_ISLAMIC_DAY,
     STATE_ATTR_ISLAMIC_MONTH,
@@ -37,15 +59,22 @@ from .const import (
     STATE_ATTR_MIN_DATE,
     STATE_ATTR_NUM_DATES,
     SUNRISE_TIME_LABEL,
+    TICKET_KEY,
     URL,
     USE_ASR_MITHL_2,
+    USE_PROCESS_POOL,
+    VALIDATORS_KEY,
+    VERSION_KEY,
     ZAWAAL_MINS,
     ZAWAAL_TIME_LABEL,
     IslamicDateStrategy,
 )
+from .index import TimetableIndex, get_changed_dates, prune_timetable
+from .plan import DayPlan
+from .scheduler import get_scheduler
 
 _LOGGER = logging.getLogger(__name__)
-PLATFORMS = ["trigger"]
+PLATFORMS = ["trigger", "sensor"]
 
 
 async def async_setup(hass: core.HomeAssistant, config: dict) -> bool:
@@ -56,9 +85,17 @@ async def async_setup(hass: core.HomeAssistant, config: dict) -> bool:
 
 async def async_setup_entry(hass: core.HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up the London Unified Prayer Times component from a config entry."""
-    lupt = Lupt(hass, entry.data)
+    lupt = Lupt(hass, entry.data, entry.entry_id)
     await lupt.async_init()
+    if not lupt.has_cached_timetable():
+        lupt.detach()
+        raise ConfigEntryNotReady(f"No timetable from {lupt.url} or local copy")
     hass.data[DOMAIN][entry.entry_id] = lupt
+    get_scheduler(hass).async_start()
+
+    hass.async_create_task(
+        hass.config_entries.async_forward_entry_setup(entry, "sensor")
+    )
 
     return True
 
@@ -78,6 +115,8 @@ async def async_unload_entry(hass: core.HomeAssistant, entry: ConfigEntry):
     if unload_ok:
         lupt = hass.data[DOMAIN].pop(entry.entry_id)
         lupt.detach()
+        get_scheduler(hass).async_stop()
+        remote.shutdown_process_pool(hass)
 
     return unload_ok
 
@@ -87,7 +126,7 @@ class Lupt(Entity):
 
     entity_id = ENTITY_ID
 
-    def __init__(self, hass, config):
+    def __init__(self, hass, config, entry_id=None):
         """Initialise lupt."""
         self.hass = hass
         self.url = config[URL]
@@ -97,6 +136,18 @@ class Lupt(Entity):
             if config[ISLAMIC_DATE_STRATEGY]
             else IslamicDateStrategy.AT_MIDNIGHT
         )
+        self.refresh_min_days = config.get(REFRESH_MIN_DAYS, DEFAULT_REFRESH_MIN_DAYS)
+        self.refresh_max_days = max(
+            self.refresh_min_days,
+            config.get(REFRESH_MAX_DAYS, DEFAULT_REFRESH_MAX_DAYS),
+        )
+        self.refresh_jitter = refresh.get_jitter(
+            entry_id, config.get(REFRESH_WINDOW_MINS, DEFAULT_REFRESH_WINDOW_MINS)
+        )
+        self.use_process_pool = config.get(USE_PROCESS_POOL, False)
+        self.retention_days = config.get(RETENTION_DAYS, DEFAULT_RETENTION_DAYS)
+        self.archive_history = config.get(ARCHIVE_HISTORY, False)
+        self.performance_sensor = config.get(PERFORMANCE_SENSOR, False)
         self._state = None
         self._attrs = {}
         self.config = lupt_config.default_config()
@@ -111,26 +162,278 @@ class Lupt(Entity):
         self.rs = self.config[lupt_constants.ConfigKeys.DEFAULT_REPLACE_STRINGS]
         self.unsub_timetable = None
         self.unsub_prayer_time = None
-        self.unsub_islamic_date = None
+        self.day_plan = None
+        self.publish_pending = False
+        self.published = None
+        self.suppressed_writes = 0
+        self.version = 0
+        self.refresh_task = None
 
     def detach(self):
         """Detach all subs."""
         self.execute_if_defined(self.unsub_timetable)
         self.execute_if_defined(self.unsub_prayer_time)
-        self.execute_if_defined(self.unsub_islamic_date)
+        if self.refresh_task and not self.refresh_task.done():
+            self.refresh_task.cancel()
 
     async def async_init(self):
         """Initialise async part of lupt."""
         self.execute_if_defined(self.unsub_timetable)
-        await self.update_timetable()
+        if not self.has_cached_timetable():
+            await self.async_load_local()
+
+        if not self.has_cached_timetable() or not self.get_cached_index().covers(
+            dt_util.utcnow()
+        ):
+            _LOGGER.info("No usable cached timetable. Waiting for remote.")
+            await self.update_timetable()
+            return
+
+        _LOGGER.info("Starting from cached timetable. Refreshing in background.")
+        self.publish_timetable()
+        self.refresh_task = self.hass.async_create_task(self.update_timetable())
+
+    async def async_load_local(self):
+        """Open the timetable snapshot, or failing that load the local copy."""
+        try:
+            (index, validators) = await self.hass.async_add_executor_job(
+                snapshot.open_snapshot_with_validators,
+                snapshot.get_snapshot_path(self.hass),
+            )
+            self.set_cached_index(self.prune_index(index))
+            self.hass.data[DOMAIN][VALIDATORS_KEY] = validators
+            self.archive_evicted(index)
+            return
+        except Exception:
+            _LOGGER.info("No timetable snapshot.")
+
+        try:
+            local_timetable = await self.hass.async_add_executor_job(
+                lambda: lupt_cache.load_cached_timetable(HASS_TIMETABLE)
+            )
+            self.commit_timetable(LOCAL_TICKET, local_timetable, {})
+        except Exception:
+            _LOGGER.info("No local timetable.")
+
+    async def async_write_snapshot(self):
+        """Write the index of the cached timetable and its validators to the snapshot.
+
+        The validators let the first refresh after a restart be conditional.
+        """
+        try:
+            await self.hass.async_add_executor_job(
+                snapshot.write_snapshot,
+                snapshot.get_snapshot_path(self.hass),
+                self.get_cached_index(),
+                self.hass.data[DOMAIN].get(VALIDATORS_KEY),
+            )
+        except Exception as err:
+            _LOGGER.warning(f"Unable to write timetable snapshot: {err!r}")
+
+    def has_cached_timetable(self):
+        """Check whether a timetable (or just its index) has been cached."""
+        return INDEX_KEY in self.hass.data[DOMAIN]
 
     def get_cached_timetable(self):
-        """Get the cached timetable."""
-        return self.hass.data[DOMAIN][CACHED_KEY]
+        """Get the cached timetable, or None if only its index is cached."""
+        return self.hass.data[DOMAIN].get(CACHED_KEY)
 
     def set_cached_timetable(self, timetable):
-        """Set the cached timetable."""
-        self.hass.data[DOMAIN][CACHED_KEY] = timetable
+        """Set the cached timetable, update its index and bump its version."""
+        data = self.hass.data[DOMAIN]
+        old_index = data.get(INDEX_KEY)
+        dates = None
+        start = time.perf_counter()
+        if old_index is None or data.get(CACHED_KEY) is None:
+            data[INDEX_KEY] = TimetableIndex(timetable)
+        else:
+            (changed, removed) = get_changed_dates(data[CACHED_KEY], timetable)
+            data[INDEX_KEY] = old_index.updated(timetable, changed, removed)
+            dates = changed + removed
+        perf.get_perf_stats(self.hass).index_seconds = time.perf_counter() - start
+        data[CACHED_KEY] = timetable
+        self.bump_version(old_index, dates)
+
+    def set_cached_index(self, index):
+        """Cache just the index of a timetable, such as an opened snapshot."""
+        data = self.hass.data[DOMAIN]
+        old_index = data.get(INDEX_KEY)
+        data.pop(CACHED_KEY, None)
+        data[INDEX_KEY] = index
+        self.bump_version(old_index)
+
+    def bump_version(self, old_index, dates=None):
+        """Bump the cached version, sending any cells changed on the dates.
+
+        The first timetable cached sends no cells, which tells listeners still
+        waiting for a timetable that every cell is new.
+        """
+        data = self.hass.data[DOMAIN]
+        data[VERSION_KEY] = data.get(VERSION_KEY, 0) + 1
+
+        if old_index is None:
+            changes = None
+        else:
+            changes = data[INDEX_KEY].diff(old_index, dates)
+            if not changes:
+                return
+        async_dispatcher_send(
+            self.hass, SIGNAL_TIMETABLE_UPDATED, data[VERSION_KEY], changes
+        )
+
+    def get_cached_version(self):
+        """Get the version of the cached timetable."""
+        return self.hass.data[DOMAIN].get(VERSION_KEY, 0)
+
+    def commit_timetable(self, ticket, timetable, validators):
+        """Cache a fetched timetable, unless a later fetch has already landed.
+
+        A timetable built in the process pool arrives as its index, which is
+        cached in its place. An unchanged timetable arrives as None, and the
+        cache is just pruned. Returns whether the cache changed.
+        """
+        data = self.hass.data[DOMAIN]
+        committed = data.get(COMMITTED_TICKET_KEY, LOCAL_TICKET)
+        if ticket < committed or ticket == committed != LOCAL_TICKET:
+            _LOGGER.info("Timetable already committed or superseded.")
+            return False
+        data[COMMITTED_TICKET_KEY] = ticket
+        data[VALIDATORS_KEY] = validators
+        if timetable is None:
+            return self.prune_cache()
+        old_index = data.get(INDEX_KEY)
+        if isinstance(timetable, TimetableIndex):
+            self.set_cached_index(self.prune_index(timetable))
+        else:
+            self.set_cached_timetable(self.prune_timetable(timetable))
+        self.archive_evicted(old_index)
+        return True
+
+    def get_first_date(self):
+        """Get the first date inside the retention window."""
+        today = dt_util.as_local(dt_util.utcnow()).date()
+        return today - timedelta(days=self.retention_days)
+
+    def prune_timetable(self, timetable):
+        """Drop days older than the retention window."""
+        first_date = self.get_first_date()
+        (pruned, evicted) = prune_timetable(timetable, first_date)
+        if evicted:
+            _LOGGER.info(f"Pruned {len(evicted)} days before {first_date}.")
+        return pruned
+
+    def prune_index(self, index):
+        """Drop indexed days older than the retention window."""
+        first_date = self.get_first_date()
+        pruned = index.pruned(first_date)
+        if pruned is not index:
+            evicted = index.num_dates - pruned.num_dates
+            _LOGGER.info(f"Pruned {evicted} days before {first_date}.")
+        return pruned
+
+    def prune_cache(self):
+        """Prune the cached timetable, or just its index, archiving evicted days.
+
+        Returns whether any days were pruned.
+        """
+        old_index = self.hass.data[DOMAIN].get(INDEX_KEY)
+        if old_index is None:
+            return False
+        timetable = self.get_cached_timetable()
+        if timetable is None:
+            index = self.prune_index(old_index)
+            if index is old_index:
+                return False
+            self.set_cached_index(index)
+        else:
+            pruned = self.prune_timetable(timetable)
+            if pruned is timetable:
+                return False
+            self.set_cached_timetable(pruned)
+        self.archive_evicted(old_index)
+        return True
+
+    def archive_evicted(self, old_index):
+        """Archive the days of the old index that have left the cache, if asked.
+
+        Days leave the cache once, so each is only archived once.
+        """
+        if not self.archive_history or old_index is None or not old_index.num_dates:
+            return
+        first_date = self.get_cached_index().min_date
+        if old_index.min_date < first_date:
+            self.hass.async_create_task(self.async_archive(old_index, first_date))
+
+    async def async_archive(self, index, first_date):
+        """Archive the days of an index before first_date."""
+        try:
+            await self.hass.async_add_executor_job(
+                snapshot.archive_index,
+                snapshot.get_archive_dir(self.hass),
+                index,
+                first_date,
+            )
+        except Exception as err:
+            _LOGGER.warning(f"Unable to archive days before {first_date}: {err!r}")
+
+    def get_breaker(self):
+        """Get the fetch breaker for this URL."""
+        breakers = self.hass.data[DOMAIN].setdefault(BREAKER_KEY, {})
+        return breakers.setdefault(self.url, FetchBreaker())
+
+    async def fetch_timetable(self):
+        """Fetch the remote timetable, joining any fetch already in flight."""
+        data = self.hass.data[DOMAIN]
+        fetches = data.setdefault(FETCH_KEY, {})
+        if self.url not in fetches:
+            if not self.get_breaker().allow(dt_util.utcnow()):
+                raise CircuitOpenError(self.url)
+            data[TICKET_KEY] = data.get(TICKET_KEY, LOCAL_TICKET) + 1
+            fetch = self.hass.async_create_task(self.async_fetch(data[TICKET_KEY]))
+            fetches[self.url] = fetch
+            fetch.add_done_callback(lambda _: fetches.pop(self.url, None))
+        return await asyncio.shield(fetches[self.url])
+
+    async def async_fetch(self, ticket):
+        """Fetch the remote timetable, tagged with the ticket it was started with."""
+        breaker = self.get_breaker()
+        try:
+            (timetable, validators) = await remote.async_init_timetable(
+                self.hass,
+                HASS_TIMETABLE,
+                self.url,
+                self.config,
+                self.hass.data[DOMAIN].get(VALIDATORS_KEY, {}),
+                self.get_cached_timetable(),
+                remote.get_process_pool(self.hass) if self.use_process_pool else None,
+                self.get_first_date(),
+            )
+        except Exception as err:
+            breaker.record_failure(dt_util.utcnow(), err)
+            raise
+        breaker.record_success(dt_util.utcnow())
+        return (ticket, timetable, validators)
+
+    def get_fetch_stats(self):
+        """Get telemetry on fetches from this URL."""
+        return self.get_breaker().get_stats(dt_util.utcnow())
+
+    def get_perf_stats(self):
+        """Get performance telemetry, with the index size and timers pending."""
+        stats = perf.get_perf_stats(self.hass).as_dict()
+        stats["index_bytes"] = self.get_cached_index().nbytes
+        stats["active_timers"] = (
+            get_scheduler(self.hass).num_pending
+            + (self.unsub_timetable is not None)
+            + (self.unsub_prayer_time is not None)
+        )
+        fetched = self.hass.data[DOMAIN].get(FETCHED_KEY)
+        stats["last_refresh"] = fetched and fetched.isoformat()
+        return stats
+
+    def get_cached_index(self):
+        """Get the index of the cached timetable."""
+        return self.hass.data[DOMAIN][INDEX_KEY]
 
     def execute_if_defined(self, func):
         """Help run a function."""
@@ -139,66 +442,118 @@ class Lupt(Entity):
 
     async def update_timetable(self, now=None):
         """Update timetable from remote."""
+        failed = False
         try:
             _LOGGER.info(f"Initialising timetable from {self.url}.")
-            temp_timetable = await self.hass.async_add_executor_job(
-                lambda: lupt_cache.init_timetable(HASS_TIMETABLE, self.url, self.config)
-            )
-        except Exception:
-            _LOGGER.info("Error initialising timetable. Trying to load local copy.")
-            temp_timetable = await self.hass.async_add_executor_job(
-                lambda: lupt_cache.load_timetable(HASS_TIMETABLE, None)
+            (ticket, temp_timetable, validators) = await self.fetch_timetable()
+        except Exception as err:
+            _LOGGER.info(f"Error initialising timetable: {err!r}")
+            failed = True
+            if not self.has_cached_timetable():
+                _LOGGER.info("Trying to load local copy.")
+                await self.async_load_local()
+        else:
+            if temp_timetable is None:
+                _LOGGER.info("Timetable unchanged, skipping rebuild.")
+            self.hass.data[DOMAIN][FETCHED_KEY] = dt_util.utcnow()
+            if self.commit_timetable(ticket, temp_timetable, validators):
+                await self.async_write_snapshot()
+
+        if self.get_cached_version() > self.version:
+            self.publish_timetable()
+
+        now = dt_util.utcnow()
+        if failed:
+            next_time = self.get_breaker().get_retry_time(now)
+        else:
+            next_time = self.get_next_refresh_time(now)
+        _LOGGER.info(f"Scheduling timetable update for {next_time}")
+        self.unsub_timetable = event.async_track_point_in_utc_time(
+            self.hass, self.update_timetable, next_time
+        )
+        async_dispatcher_send(self.hass, SIGNAL_UPDATE)
+
+    def get_next_refresh_time(self, dt):
+        """Work out the next fetch from coverage left and the last fetch's age."""
+        if not self.has_cached_timetable():
+            return refresh.get_next_refresh(
+                dt, dt, self.refresh_min_days, self.refresh_jitter
             )
 
-        self.set_cached_timetable(temp_timetable)
+        index = self.get_cached_index()
+        today = dt_util.as_local(dt).date()
+        try:
+            islamic_day = index.get_islamic_date(today)[2]
+            correction_expected = refresh.is_correction_expected(islamic_day)
+        except KeyError:
+            correction_expected = True
+
+        interval = refresh.get_refresh_interval(
+            (index.max_date - today).days,
+            correction_expected,
+            self.refresh_min_days,
+            self.refresh_max_days,
+        )
+        last_fetched = self.hass.data[DOMAIN].get(FETCHED_KEY, index.last_updated)
+        return refresh.get_next_refresh(dt, last_fetched, interval, self.refresh_jitter)
 
+    @callback
+    def publish_timetable(self):
+        """Republish everything derived from the cached timetable."""
+        self.version = self.get_cached_version()
         self.calculate_stats()
 
         dt = dt_util.utcnow()
         for prayer in self.times:
             self.calculate_next_prayer_time(prayer, dt)
 
-        self.async_write_ha_state()
+        self.async_publish()
 
         self.execute_if_defined(self.unsub_prayer_time)
+        self.day_plan = None
         self.update_prayer_time()
 
-        self.execute_if_defined(self.unsub_islamic_date)
-        self.update_islamic_date()
-
-        now = dt_util.now()
-        tomorrow = now + timedelta(days=1)
-        sod = dt_util.start_of_local_day(tomorrow)
-        next_time = sod + timedelta(minutes=15)
-        next_time_utc = dt_util.as_utc(next_time)
+    @callback
+    def async_publish(self):
+        """Write state once this tick, unless nothing has changed."""
+        if self.publish_pending:
+            self.suppressed_writes += 1
+            return
+        self.publish_pending = True
+        self.hass.loop.call_soon(self.async_flush)
 
-        _LOGGER.info(f"Scheduling timetable update for {next_time}")
-        self.unsub_timetable = event.async_track_point_in_utc_time(
-            self.hass, self.update_timetable, next_time_utc
-        )
+    @callback
+    def async_flush(self):
+        """Write state and let the sensors pick up their values."""
+        self.publish_pending = False
+        snapshot = (self._state, dict(self._attrs))
+        if snapshot == self.published:
+            self.suppressed_writes += 1
+            return
+        self.published = snapshot
+        self.async_write_ha_state()
+        async_dispatcher_send(self.hass, SIGNAL_UPDATE)
 
     @callback
+    @perf.timed("update_prayer_time")
     def update_prayer_time(self, now=None):
-        """Calculate current prayer, update state and set up next update."""
+        """Apply due transitions from the day plan and set up next update."""
         utc_point_in_time = dt_util.utcnow()
-        next_time = self.calculate_prayer_time(utc_point_in_time)
-        self.async_write_ha_state()
+        if self.day_plan is None or self.day_plan.is_finished(utc_point_in_time):
+            self.day_plan = self.build_day_plan(utc_point_in_time)
+
+        for (_, state, attrs) in self.day_plan.advance(utc_point_in_time):
+            if state is not None:
+                self._state = state
+            self._attrs.update(attrs)
+
+        self.async_publish()
+        next_time = self.day_plan.next_time
         _LOGGER.info(f"Scheduling state update for {next_time}")
         self.unsub_prayer_time = event.async_track_point_in_utc_time(
             self.hass, self.update_prayer_time, next_time
         )
 
-    @callback
-    def update_islamic_date(self, now=None):
-        """Calculate current idate, update state and set up next update."""
-        utc_point_in_time = dt_util.utcnow()
-        next_time = self.calculate_islamic_date(utc_point_in_time)
-        self.async_write_ha_state()
-        _LOGGER.info(f"Scheduling Islamic Date update for {next_time}")
-        self.unsub_islamic_date = event.async_track_point_in_utc_time(
-            self.hass, self.update_islamic_date, next_time
-        )
-
     @property
     def name(self):
         """Friendly name."""
@@ -216,64 +571,114 @@ class Lupt(Entity):
 
     def calculate_stats(self):
         """Set up statistics."""
-        info = lupt_query.get_info(self.get_cached_timetable())
-        self._attrs[STATE_ATTR_LAST_UPDATED] = info[3][0].isoformat()
-        self._attrs[STATE_ATTR_MIN_DATE] = info[2][1].isoformat()
-        self._attrs[STATE_ATTR_MAX_DATE] = info[2][2].isoformat()
-        self._attrs[STATE_ATTR_NUM_DATES] = info[2][0]
+        index = self.get_cached_index()
+        self._attrs[STATE_ATTR_LAST_UPDATED] = index.last_updated.isoformat()
+        self._attrs[STATE_ATTR_MIN_DATE] = index.min_date.isoformat()
+        self._attrs[STATE_ATTR_MAX_DATE] = index.max_date.isoformat()
+        self._attrs[STATE_ATTR_NUM_DATES] = index.num_dates
 
-    def calculate_islamic_date(self, dt):
-        """Set up Islamic Date."""
+    def get_islamic_date(self, dt):
+        """Work out the Islamic Date attributes at dt and when they next change."""
 
         next_time = None
         idate = None
 
         if self.islamic_date_strategy == IslamicDateStrategy.AT_MAGHRIB:
-            next_time = self.calculate_next_prayer_time(MAGHRIB_TIME_LABEL, dt)
+            next_time = self.get_next_prayer_time(MAGHRIB_TIME_LABEL, dt)[2]
             idate = next_time.date()
         else:  # IslamicDateStrategy.AT_MIDNIGHT
-            next_time = dt_util.start_of_local_day(dt)
+            local_dt = dt_util.as_local(dt)
+            next_time = dt_util.start_of_local_day(local_dt)
             next_time = next_time + timedelta(days=1)
-            idate = dt.date()
+            idate = local_dt.date()
 
-        (iyear, imonth, iday) = lupt_query.get_islamic_date(
-            self.get_cached_timetable(), idate
-        )
-        self._attrs[STATE_ATTR_ISLAMIC_DATE] = f"{iday} {imonth} {iyear}"
-        self._attrs[STATE_ATTR_ISLAMIC_YEAR] = iyear
-        self._attrs[STATE_ATTR_ISLAMIC_MONTH] = imonth
-        self._attrs[STATE_ATTR_ISLAMIC_DAY] = iday
+        (iyear, imonth, iday) = self.get_cached_index().get_islamic_date(idate)
+        attrs = {
+            STATE_ATTR_ISLAMIC_DATE: f"{iday} {imonth} {iyear}",
+            STATE_ATTR_ISLAMIC_YEAR: iyear,
+            STATE_ATTR_ISLAMIC_MONTH: imonth,
+            STATE_ATTR_ISLAMIC_DAY: iday,
+        }
+
+        return attrs, dt_util.as_utc(next_time)
+
+    def calculate_islamic_date(self, dt):
+        """Set up Islamic Date."""
+        attrs, next_time = self.get_islamic_date(dt)
+        self._attrs.update(attrs)
+        return next_time
 
-        return dt_util.as_utc(next_time)
+    def format_prayer(self, prayer):
+        """Format a prayer name for display."""
+        return lupt_report.perform_replace_strings(prayer, self.rs)
+
+    def next_time_attribute(self, prayer):
+        """Name the attribute holding the next time for given prayer."""
+        return f"next_{self.format_prayer(prayer).lower()}"
+
+    def get_next_prayer_time(self, prayer, dt):
+        """Work out the attribute holding the next time for given prayer."""
+        next_prayer = self.get_cached_index().get_now_and_next([prayer], dt)[1]
+        next_time = next_prayer[1]
+        return (
+            self.next_time_attribute(prayer),
+            next_time.isoformat(),
+            dt_util.as_utc(next_time),
+        )
 
     def calculate_next_prayer_time(self, prayer, dt):
         """Set up the next time for given prayer."""
-        next_prayer = lupt_query.get_now_and_next(
-            self.get_cached_timetable(), [prayer], dt
-        )[1]
-        formatted_prayer_time = lupt_report.perform_replace_strings(
-            prayer, self.rs
-        ).lower()
-        next_time = next_prayer[1]
-        self._attrs[f"next_{formatted_prayer_time}"] = next_time.isoformat()
-        return dt_util.as_utc(next_time)
+        (key, value, next_time) = self.get_next_prayer_time(prayer, dt)
+        self._attrs[key] = value
+        return next_time
 
-    def calculate_prayer_time(self, dt):
-        """Calculate current prayer."""
-        nandn = lupt_query.get_now_and_next(self.get_cached_timetable(), self.times, dt)
+    def get_prayer_state(self, dt):
+        """Work out the current prayer, the state and when it next changes."""
+        nandn = self.get_cached_index().get_now_and_next(self.times, dt)
         current_prayer = nandn[0][0]
-        self._state = lupt_report.perform_replace_strings(current_prayer, self.rs)
+        state = self.format_prayer(current_prayer)
 
         next_time = nandn[1][1]
 
         if current_prayer == SUNRISE_TIME_LABEL:
             zawaal_time = next_time - self.zawaal_delta
             if zawaal_time <= dt:
-                self._state = ZAWAAL_TIME_LABEL
+                state = ZAWAAL_TIME_LABEL
             else:
-                self._state = DUHA_STATE_LABEL
+                state = DUHA_STATE_LABEL
                 next_time = zawaal_time
 
+        return current_prayer, state, dt_util.as_utc(next_time)
+
+    def calculate_prayer_time(self, dt):
+        """Calculate current prayer."""
+        (current_prayer, self._state, next_time) = self.get_prayer_state(dt)
         self.calculate_next_prayer_time(current_prayer, dt)
+        return next_time
 
-        return dt_util.as_utc(next_time)
+    def build_day_plan(self, dt):
+        """Precompute every transition from dt until the end of its local day."""
+        tomorrow = dt_util.as_local(dt) + timedelta(days=1)
+        end = dt_util.as_utc(dt_util.start_of_local_day(tomorrow))
+        steps = []
+
+        point = dt
+        try:
+            while point < end:
+                (current_prayer, state, next_point) = self.get_prayer_state(point)
+                (key, value, _) = self.get_next_prayer_time(current_prayer, point)
+                steps.append((point, state, {key: value}))
+                point = next_point
+        except KeyError:
+            if point == dt:
+                raise
+            _LOGGER.warning(f"Timetable runs out at {point}.")
+            end = point
+
+        point = dt
+        while point < end:
+            (attrs, next_point) = self.get_islamic_date(point)
+            steps.append((point, None, attrs))
+            point = next_point
+
+        return DayPlan(steps, end)
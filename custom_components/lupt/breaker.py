@@ -0,0 +1,86 @@
+"""Retry backoff and circuit breaking for lupt timetable fetches."""
+from datetime import timedelta
+
+from homeassistant import exceptions
+
+RETRY_BASE = timedelta(minutes=2)
+RETRY_MAX = timedelta(hours=3)
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = timedelta(hours=6)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class FetchBreaker:
+    """Track fetch attempts for one URL and decide when to try again.
+
+    Failures back off exponentially from RETRY_BASE up to RETRY_MAX. After
+    BREAKER_THRESHOLD failures in a row the circuit opens and fetches are
+    refused until BREAKER_COOLDOWN has passed, when a single trial fetch is let
+    through (half open). A success closes the circuit again.
+    """
+
+    def __init__(self):
+        """Initialise breaker."""
+        self.attempts = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.rejected = 0
+        self.last_error = None
+        self.last_success = None
+        self.open_until = None
+
+    def get_state(self, dt):
+        """Return whether the circuit is closed, open or half open at dt."""
+        if self.open_until is None:
+            return STATE_CLOSED
+        if dt < self.open_until:
+            return STATE_OPEN
+        return STATE_HALF_OPEN
+
+    def allow(self, dt):
+        """Check whether a fetch may go ahead at dt, counting refusals."""
+        if self.get_state(dt) == STATE_OPEN:
+            self.rejected += 1
+            return False
+        self.attempts += 1
+        return True
+
+    def record_success(self, dt):
+        """Close the circuit after a successful fetch."""
+        self.consecutive_failures = 0
+        self.open_until = None
+        self.last_success = dt
+
+    def record_failure(self, dt, error):
+        """Count a failed fetch, opening the circuit if there are too many."""
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_error = repr(error)
+        if self.consecutive_failures >= BREAKER_THRESHOLD:
+            self.open_until = dt + BREAKER_COOLDOWN
+
+    def get_retry_time(self, dt):
+        """Work out when to try again after a failure at dt."""
+        if self.get_state(dt) == STATE_OPEN:
+            return self.open_until
+        exponent = max(self.consecutive_failures - 1, 0)
+        return dt + min(RETRY_MAX, RETRY_BASE * 2 ** min(exponent, 16))
+
+    def get_stats(self, dt):
+        """Return fetch telemetry at dt."""
+        return {
+            "fetch_attempts": self.attempts,
+            "fetch_failures": self.failures,
+            "fetch_consecutive_failures": self.consecutive_failures,
+            "fetch_rejected": self.rejected,
+            "fetch_circuit": self.get_state(dt),
+            "fetch_last_error": self.last_error,
+            "fetch_last_success": self.last_success and self.last_success.isoformat(),
+        }
+
+
+class CircuitOpenError(exceptions.HomeAssistantError):
+    """Error to indicate the circuit for a URL is open."""
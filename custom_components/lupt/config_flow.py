@@ -3,8 +3,9 @@
 from typing import Any, Dict, Optional
 
 from homeassistant import config_entries, exceptions
-from london_unified_prayer_times import config, constants, remote_data, timetable
+from london_unified_prayer_times import config, constants, timetable
 
+from . import remote
 from .const import CONFIG_SCHEMA, DOMAIN, HTML_CLASS, NAME, URL
 
 DEFAULT_CONFIG = config.default_config()
@@ -12,15 +13,19 @@ DEFAULT_CSS = DEFAULT_CONFIG[constants.ConfigKeys.HTML_TABLE_CSS_CLASS]
 
 
 async def validate_url(hass, url, css):
-    """Validate the config provided."""
+    """Validate the config provided, keeping the probed page if it's good."""
+    prefetch = None
     try:
-        data = await hass.async_add_executor_job(
-            lambda: remote_data.get_html_data(url, css)
+        (rows, prefetch) = await remote.async_probe_url(hass, url, css)
+        await hass.async_add_executor_job(
+            lambda: timetable.build_timetable("test", url, DEFAULT_CONFIG, rows)
         )
-        timetable.build_timetable("test", url, DEFAULT_CONFIG, data)
     except Exception:
+        if prefetch is not None:
+            remote.discard_prefetch(prefetch)
         raise UrlValueError
 
+    remote.store_prefetch(hass, url, prefetch)
     return url
 
 
@@ -13,7 +13,33 @@ HTML_CLASS = "html_table_css_class"
 ZAWAAL_MINS = "zawaal_mins"
 ISLAMIC_DATE_STRATEGY = "islamic_date_at_maghrib"
 USE_ASR_MITHL_2 = "use_asr_mithl_2"
+REFRESH_MIN_DAYS = "refresh_min_days"
+REFRESH_MAX_DAYS = "refresh_max_days"
+REFRESH_WINDOW_MINS = "refresh_window_mins"
+USE_PROCESS_POOL = "use_process_pool"
+RETENTION_DAYS = "retention_days"
+ARCHIVE_HISTORY = "archive_history"
+PERFORMANCE_SENSOR = "performance_sensor"
+DEFAULT_REFRESH_MIN_DAYS = 1
+DEFAULT_REFRESH_MAX_DAYS = 14
+DEFAULT_REFRESH_WINDOW_MINS = 60
+DEFAULT_RETENTION_DAYS = 7
 CACHED_KEY = "cached_timetable"
+INDEX_KEY = "cached_index"
+SCHEDULER_KEY = "scheduler"
+VERSION_KEY = "version"
+VALIDATORS_KEY = "validators"
+FETCH_KEY = "fetches"
+TICKET_KEY = "ticket"
+COMMITTED_TICKET_KEY = "committed_ticket"
+FETCHED_KEY = "fetched"
+BREAKER_KEY = "breakers"
+PREFETCH_KEY = "prefetches"
+POOL_KEY = "process_pool"
+PERF_KEY = "perf"
+LOCAL_TICKET = 0
+SIGNAL_UPDATE = f"{DOMAIN}_update"
+SIGNAL_TIMETABLE_UPDATED = f"{DOMAIN}_timetable_updated"
 
 CONFIG_SCHEMA = vol.Schema(
     {
@@ -22,6 +48,19 @@ CONFIG_SCHEMA = vol.Schema(
         vol.Required(ZAWAAL_MINS, default=10): cv.positive_int,
         vol.Required(ISLAMIC_DATE_STRATEGY, default=False): cv.boolean,
         vol.Required(USE_ASR_MITHL_2, default=False): cv.boolean,
+        vol.Optional(
+            REFRESH_MIN_DAYS, default=DEFAULT_REFRESH_MIN_DAYS
+        ): cv.positive_int,
+        vol.Optional(
+            REFRESH_MAX_DAYS, default=DEFAULT_REFRESH_MAX_DAYS
+        ): cv.positive_int,
+        vol.Optional(
+            REFRESH_WINDOW_MINS, default=DEFAULT_REFRESH_WINDOW_MINS
+        ): cv.positive_int,
+        vol.Optional(USE_PROCESS_POOL, default=False): cv.boolean,
+        vol.Optional(RETENTION_DAYS, default=DEFAULT_RETENTION_DAYS): cv.positive_int,
+        vol.Optional(ARCHIVE_HISTORY, default=False): cv.boolean,
+        vol.Optional(PERFORMANCE_SENSOR, default=False): cv.boolean,
     },
 )
 
@@ -0,0 +1,32 @@
+"""Diagnostics for lupt."""
+from .const import DOMAIN, VALIDATORS_KEY
+from .perf import get_size
+
+
+async def async_get_config_entry_diagnostics(hass, entry):
+    """Return the timetable, fetch and performance diagnostics of an entry."""
+    lupt = hass.data[DOMAIN][entry.entry_id]
+    index = lupt.get_cached_index()
+    timetable = lupt.get_cached_timetable()
+    timetable_bytes = None
+    if timetable is not None:
+        timetable_bytes = await hass.async_add_executor_job(get_size, timetable)
+
+    return {
+        "config": dict(entry.data),
+        "timetable": {
+            "version": lupt.get_cached_version(),
+            "last_updated": index.last_updated.isoformat(),
+            "min_date": index.min_date.isoformat() if index.num_dates else None,
+            "max_date": index.max_date.isoformat() if index.num_dates else None,
+            "num_dates": index.num_dates,
+            "num_events": len(index),
+            "validators": hass.data[DOMAIN].get(VALIDATORS_KEY),
+            "timetable_bytes": timetable_bytes,
+        },
+        "fetch": lupt.get_fetch_stats(),
+        "performance": {
+            **lupt.get_perf_stats(),
+            "suppressed_writes": lupt.suppressed_writes,
+        },
+    }
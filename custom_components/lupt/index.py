@@ -0,0 +1,360 @@
+"""Precomputed event index for lupt timetables."""
+from array import array
+from bisect import bisect_left, bisect_right
+import copy
+from datetime import date
+import struct
+import sys
+
+from homeassistant.util import dt as dt_util
+from london_unified_prayer_times import (
+    constants as lupt_constants,
+    timetable as lupt_timetable,
+)
+
+tk = lupt_constants.TimetableKeys
+
+MAGIC = b"LUPT"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHIHHd")
+STRINGS = struct.Struct("<I")
+
+
+def get_changed_dates(old_timetable, timetable):
+    """List the dates whose days are new, replaced or removed in a timetable.
+
+    Days carried over unchanged by a merge are the same objects, so they are
+    recognised by identity without comparing their times.
+    """
+    old_days = old_timetable[tk.DATES]
+    new_days = timetable[tk.DATES]
+    changed = [dt for dt, day in new_days.items() if old_days.get(dt) is not day]
+    removed = [dt for dt in old_days if dt not in new_days]
+    return changed, removed
+
+
+def prune_timetable(timetable, first_date):
+    """Split off the days before first_date, if any days would be left.
+
+    Returns the pruned timetable, sharing its days with the original, and a
+    dict of the days split off.
+    """
+    days = timetable[tk.DATES]
+    evicted = {dt: day for dt, day in days.items() if dt < first_date}
+    if not evicted or len(evicted) == len(days):
+        return timetable, {}
+
+    pruned = dict(timetable)
+    pruned[tk.DATES] = {dt: day for dt, day in days.items() if dt >= first_date}
+    pruned[tk.STATS] = dict(timetable[tk.STATS])
+    pruned[tk.STATS][tk.NUMBER_OF_DATES] = len(pruned[tk.DATES])
+    pruned[tk.STATS][tk.MIN_DATE] = min(pruned[tk.DATES])
+    return pruned, evicted
+
+
+class TimetableIndex:
+    """Compact, columnar index of a timetable's events and Islamic dates.
+
+    Each event has a column of int32 minutes since the epoch (UTC), one per
+    day, alongside a column of date ordinals and a column of packed Islamic
+    dates (year * 10000 + month * 100 + day) whose month names are interned.
+    """
+
+    def __init__(self, timetable):
+        """Build the index once from a library timetable."""
+        self.dates = array("i")
+        self.islamic_dates = array("i")
+        self.months = []
+        self.columns = {}
+        self.last_updated = timetable[tk.STATS][tk.LAST_UPDATED]
+
+        for dt, day in sorted(timetable[tk.DATES].items()):
+            self.dates.append(dt.toordinal())
+            self.islamic_dates.append(self._pack_islamic_date(day))
+
+            for label, time in day[tk.TIMES].items():
+                if label not in self.columns:
+                    self.columns[sys.intern(label)] = array("i")
+                self.columns[label].append(int(time.timestamp()) // 60)
+
+    def to_bytes(self):
+        """Serialise the index into a compact little-endian columnar buffer.
+
+        The header holds the counts and last updated time, followed by the
+        event labels and month names padded to a multiple of four bytes, then
+        the date, Islamic date and event columns as int32s.
+        """
+        strings = "\n".join([*self.columns, *self.months]).encode()
+        padding = -(HEADER.size + STRINGS.size + len(strings)) % 4
+        parts = [
+            HEADER.pack(
+                MAGIC,
+                FORMAT_VERSION,
+                len(self.dates),
+                len(self.columns),
+                len(self.months),
+                self.last_updated.timestamp(),
+            ),
+            STRINGS.pack(len(strings)),
+            strings,
+            bytes(padding),
+        ]
+        for column in [self.dates, self.islamic_dates, *self.columns.values()]:
+            column = array("i", column)
+            if sys.byteorder == "big":
+                column.byteswap()
+            parts.append(column.tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, buffer):
+        """Load an index serialised by to_bytes.
+
+        On little-endian hosts the columns are views onto the buffer rather
+        than copies, so a memory-mapped buffer is only read where it's used.
+        """
+        view = memoryview(buffer)
+        (
+            magic,
+            version,
+            num_dates,
+            num_labels,
+            num_months,
+            last_updated,
+        ) = HEADER.unpack_from(view)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported index format {magic!r} {version}")
+        offset = HEADER.size
+        (length,) = STRINGS.unpack_from(view, offset)
+        offset += STRINGS.size
+        strings = str(view[offset : offset + length], "utf-8").split("\n")
+        offset += length + -(offset + length) % 4
+        if not length:
+            strings = []
+        if offset + (num_labels + 2) * num_dates * 4 != len(view):
+            raise ValueError("Truncated or corrupt index")
+
+        def read_column():
+            nonlocal offset
+            column = view[offset : offset + num_dates * 4]
+            offset += num_dates * 4
+            if sys.byteorder == "big":
+                column = array("i", column.tobytes())
+                column.byteswap()
+                return column
+            return column.cast("i")
+
+        index = cls.__new__(cls)
+        index.last_updated = dt_util.utc_from_timestamp(last_updated)
+        index.months = [sys.intern(x) for x in strings[num_labels:]]
+        index.dates = read_column()
+        index.islamic_dates = read_column()
+        index.columns = {sys.intern(x): read_column() for x in strings[:num_labels]}
+        if len(index.months) != num_months:
+            raise ValueError("Truncated or corrupt index")
+        return index
+
+    def to_timetable(self, name, source, config):
+        """Rebuild a library timetable from the index."""
+        built = lupt_timetable.create_empty_timetable(name, source, config)
+        built[tk.STATS][tk.LAST_UPDATED] = self.last_updated
+        days = built[tk.DATES]
+        for i, ordinal in enumerate(self.dates):
+            packed = self.islamic_dates[i]
+            times = {
+                label: dt_util.utc_from_timestamp(column[i] * 60)
+                for label, column in self.columns.items()
+            }
+            days[date.fromordinal(ordinal)] = {
+                tk.ISLAMIC_DATE: (
+                    packed // 10000,
+                    self.months[packed // 100 % 100],
+                    packed % 100,
+                ),
+                tk.TIMES: dict(sorted(times.items(), key=lambda k: k[1])),
+            }
+
+        stats = built[tk.STATS]
+        stats[tk.NUMBER_OF_DATES] = self.num_dates
+        if self.dates:
+            stats[tk.MIN_DATE] = self.min_date
+            stats[tk.MAX_DATE] = self.max_date
+        stats[tk.ISLAMIC_MONTHS] = list(self.months)
+        return built
+
+    def _pack_islamic_date(self, day):
+        """Pack a day's Islamic date, interning its month."""
+        (iyear, imonth, iday) = day[tk.ISLAMIC_DATE]
+        if imonth not in self.months:
+            self.months.append(sys.intern(imonth))
+        return iyear * 10000 + self.months.index(imonth) * 100 + iday
+
+    def updated(self, timetable, changed, removed):
+        """Return an index of timetable, re-indexing only the changed dates.
+
+        Changed dates must either already be indexed or come after the last
+        indexed date, with the same events, and removed dates must be the
+        first indexed ones; otherwise the index is rebuilt.
+        """
+        days = timetable[tk.DATES]
+        drop = len(removed)
+        removed_ordinals = sorted(dt.toordinal() for dt in removed)
+        kept_dates = self.dates[drop:]
+        positions = {ordinal: i for i, ordinal in enumerate(kept_dates)}
+        ordinals = sorted(dt.toordinal() for dt in changed)
+        new_ordinals = [x for x in ordinals if x not in positions]
+        if (
+            removed_ordinals != list(self.dates[:drop])
+            or not kept_dates
+            or (new_ordinals and new_ordinals[0] <= kept_dates[-1])
+            or any(days[dt][tk.TIMES].keys() != self.columns.keys() for dt in changed)
+        ):
+            return TimetableIndex(timetable)
+
+        index = copy.copy(self)
+        index.dates = array("i", kept_dates)
+        index.islamic_dates = array("i", self.islamic_dates[drop:])
+        index.months = list(self.months)
+        index.columns = {
+            label: array("i", x[drop:]) for label, x in self.columns.items()
+        }
+        index.last_updated = timetable[tk.STATS][tk.LAST_UPDATED]
+
+        for ordinal in ordinals:
+            day = days[date.fromordinal(ordinal)]
+            packed = index._pack_islamic_date(day)
+            position = positions.get(ordinal)
+            if position is None:
+                index.dates.append(ordinal)
+                index.islamic_dates.append(packed)
+            else:
+                index.islamic_dates[position] = packed
+            for label, time in day[tk.TIMES].items():
+                minutes = int(time.timestamp()) // 60
+                if position is None:
+                    index.columns[label].append(minutes)
+                else:
+                    index.columns[label][position] = minutes
+
+        return index
+
+    def pruned(self, first_date):
+        """Return an index without the dates before first_date, if any are left.
+
+        Like prune_timetable, the index itself is returned if no dates or
+        every date would go.
+        """
+        drop = bisect_left(self.dates, first_date.toordinal())
+        if not drop or drop == len(self.dates):
+            return self
+
+        index = copy.copy(self)
+        index.dates = array("i", self.dates[drop:])
+        index.islamic_dates = array("i", self.islamic_dates[drop:])
+        index.columns = {
+            label: array("i", x[drop:]) for label, x in self.columns.items()
+        }
+        return index
+
+    def __len__(self):
+        """Return the number of indexed events."""
+        return sum(len(column) for column in self.columns.values())
+
+    @property
+    def nbytes(self):
+        """Return the approximate size of the columns in bytes."""
+        columns = [self.dates, self.islamic_dates, *self.columns.values()]
+        return sum(column.itemsize * len(column) for column in columns)
+
+    @property
+    def num_dates(self):
+        """Return the number of indexed dates."""
+        return len(self.dates)
+
+    @property
+    def min_date(self):
+        """Return the first indexed date."""
+        return date.fromordinal(self.dates[0])
+
+    @property
+    def max_date(self):
+        """Return the last indexed date."""
+        return date.fromordinal(self.dates[-1])
+
+    def covers(self, dt):
+        """Check whether events exist either side of the given time."""
+        if not self.columns:
+            return False
+        minutes = dt.timestamp() / 60
+        first = min(column[0] for column in self.columns.values())
+        last = max(column[-1] for column in self.columns.values())
+        return first <= minutes < last
+
+    def get_now_and_next(self, times, dt):
+        """Find the current and next event, like lupt_query.get_now_and_next."""
+        minutes = dt.timestamp() / 60
+        now_event = None
+        next_event = None
+
+        for label in times:
+            column = self.columns.get(label)
+            if not column:
+                continue
+            index = bisect_right(column, minutes)
+            if index > 0:
+                candidate = (column[index - 1], label)
+                if now_event is None or candidate > now_event:
+                    now_event = candidate
+            if index < len(column):
+                candidate = (column[index], label)
+                if next_event is None or candidate < next_event:
+                    next_event = candidate
+
+        if now_event is None or next_event is None:
+            raise KeyError(dt.date())
+
+        return (
+            (now_event[1], dt_util.utc_from_timestamp(now_event[0] * 60)),
+            (next_event[1], dt_util.utc_from_timestamp(next_event[0] * 60)),
+        )
+
+    def diff(self, other, dates=None):
+        """List the (event, date) cells that differ from an older index.
+
+        Returns a dict of event to [(date, old minutes, new minutes)], with None
+        for cells that are missing from either index. Only the given dates are
+        compared, if any.
+        """
+        old_positions = {ordinal: i for i, ordinal in enumerate(other.dates)}
+        new_positions = {ordinal: i for i, ordinal in enumerate(self.dates)}
+        if dates is None:
+            ordinals = sorted(old_positions.keys() | new_positions.keys())
+        else:
+            ordinals = sorted(dt.toordinal() for dt in dates)
+        changes = {}
+
+        for label in self.columns.keys() | other.columns.keys():
+            old_column = other.columns.get(label)
+            new_column = self.columns.get(label)
+            for ordinal in ordinals:
+                old = new = None
+                if old_column and ordinal in old_positions:
+                    old = old_column[old_positions[ordinal]]
+                if new_column and ordinal in new_positions:
+                    new = new_column[new_positions[ordinal]]
+                if old != new:
+                    changes.setdefault(label, []).append(
+                        (date.fromordinal(ordinal), old, new)
+                    )
+
+        return changes
+
+    def get_islamic_date(self, gregorian_date):
+        """Find the Islamic date, like lupt_query.get_islamic_date."""
+        ordinal = gregorian_date.toordinal()
+        index = bisect_left(self.dates, ordinal)
+        if index == len(self.dates) or self.dates[index] != ordinal:
+            raise KeyError(gregorian_date)
+
+        packed = self.islamic_dates[index]
+        return (packed // 10000, self.months[packed // 100 % 100], packed % 100)
@@ -0,0 +1,207 @@
+"""Streaming ingestion of lupt timetable pages."""
+import codecs
+import hashlib
+from html.parser import HTMLParser
+
+import dateutil.parser
+from london_unified_prayer_times import (
+    cache as lupt_cache,
+    constants as lupt_constants,
+    timetable as lupt_timetable,
+)
+
+from .index import TimetableIndex
+
+ck = lupt_constants.ConfigKeys
+tk = lupt_constants.TimetableKeys
+
+ROW_DIGEST = "row_digest"
+
+
+def get_row_digest(row):
+    """Digest a timetable row as parsed from the page."""
+    return hashlib.sha256(repr(sorted(row.items())).encode()).hexdigest()
+
+
+class RowParser(HTMLParser):
+    """Collect timetable rows as a page is fed in, like parse_html_data."""
+
+    def __init__(self, css_class):
+        """Initialise parser."""
+        super().__init__()
+        self.css_class = css_class
+        self.headings = []
+        self.rows = []
+        self._sections = 0
+        self._in_table = False
+        self._done = False
+        self._part = None
+        self._row = None
+        self._cell = None
+
+    def handle_starttag(self, tag, attrs):
+        """Track the table of the section with the CSS class."""
+        if self._done:
+            return
+        if tag == "section":
+            classes = (dict(attrs).get("class") or "").split()
+            if self._sections or self.css_class in classes:
+                self._sections += 1
+        elif not self._sections:
+            return
+        elif tag == "table":
+            self._in_table = True
+        elif not self._in_table:
+            return
+        elif tag in ("thead", "tbody"):
+            self._part = tag
+        elif tag == "tr":
+            self._row = []
+        elif tag in ("th", "td") and self._row is not None:
+            if (tag == "th") == (self._part == "thead"):
+                self._cell = []
+
+    def handle_data(self, data):
+        """Collect cell text."""
+        if self._cell is not None:
+            self._cell.append(data)
+
+    def handle_endtag(self, tag):
+        """Finish cells, rows and the table."""
+        if self._done:
+            return
+        if tag == "section" and self._sections:
+            self._sections -= 1
+            self._done = self._sections == 0 and self._in_table
+        elif tag in ("th", "td") and self._cell is not None:
+            self._row.append("".join(self._cell))
+            self._cell = None
+        elif tag == "tr" and self._row is not None:
+            if self._part == "thead" and not self.headings:
+                self.headings = self._row
+            elif self._part == "tbody":
+                self.rows.append(dict(zip(self.headings, self._row)))
+            self._row = None
+        elif tag in ("thead", "tbody"):
+            self._part = None
+        elif tag == "table" and self._in_table:
+            self._done = True
+
+
+class TimetableBuilder:
+    """Build a timetable from a page as its bytes arrive.
+
+    Rows are turned into days as soon as they are parsed, so neither the page
+    nor its rows are held in full. Days of a previous timetable are reused for
+    rows that have not changed, and are the same objects. Rows dated before
+    first_date, if given, are skipped.
+    """
+
+    def __init__(
+        self, name, url, config, previous=None, charset="utf-8", first_date=None
+    ):
+        """Initialise builder."""
+        self.name = name
+        self.url = url
+        self.config = config
+        self.first_date = first_date
+        self.days = {}
+        self.reused = 0
+        self.skipped = 0
+        self._parser = RowParser(config[ck.HTML_TABLE_CSS_CLASS])
+        self._decoder = codecs.getincrementaldecoder(charset)("replace")
+        self._pinfo = dateutil.parser.parserinfo(
+            config[ck.DAY_FIRST], config[ck.YEAR_FIRST]
+        )
+        self._known = {}
+        if previous and previous[tk.SETUP][tk.CONFIG] == config:
+            self._previous = previous[tk.DATES]
+            self._known = {
+                day[ROW_DIGEST]: dt
+                for dt, day in self._previous.items()
+                if ROW_DIGEST in day
+            }
+
+    def feed(self, chunk):
+        """Feed in the next bytes of the page, building any completed rows."""
+        self._parser.feed(self._decoder.decode(chunk))
+        self._build_rows()
+
+    def _build_rows(self):
+        """Turn the rows parsed so far into days."""
+        for row in self._parser.rows:
+            digest = get_row_digest(row)
+            dt = self._known.get(digest)
+            if dt is not None:
+                self.days[dt] = self._previous[dt]
+                self.reused += 1
+                continue
+            dt = lupt_timetable.fix_gregorian_date(
+                row[self.config[ck.DATA_GREGORIAN_DATE]], self._pinfo
+            )
+            if self.first_date is not None and dt < self.first_date:
+                self.skipped += 1
+                continue
+            day = self.build_day(row, dt)
+            day[ROW_DIGEST] = digest
+            self.days[dt] = day
+        self._parser.rows.clear()
+
+    def build_day(self, row, dt):
+        """Build the day of a row, like lupt_timetable.build_timetable."""
+        config = self.config
+        prayers = {
+            prayer: lupt_timetable.unaware_prayer_time_to_utc(
+                row[prayer], dt, prayer, config
+            )
+            for prayer in config[ck.TIMES]
+        }
+        return {
+            tk.ISLAMIC_DATE: (
+                int(row[config[ck.DATA_ISLAMIC_YEAR]]),
+                row[config[ck.DATA_ISLAMIC_MONTH]],
+                int(row[config[ck.DATA_ISLAMIC_DAY]]),
+            ),
+            tk.TIMES: dict(sorted(prayers.items(), key=lambda k: k[1])),
+        }
+
+    def finish(self):
+        """Return the timetable built from the whole page."""
+        self._parser.feed(self._decoder.decode(b"", final=True))
+        self._parser.close()
+        self._build_rows()
+        if not self.days:
+            raise ValueError(f"No timetable rows found at {self.url}")
+
+        built = lupt_timetable.create_empty_timetable(self.name, self.url, self.config)
+        built[tk.DATES] = dict(sorted(self.days.items()))
+        stats = built[tk.STATS]
+        stats[tk.NUMBER_OF_DATES] = len(self.days)
+        stats[tk.MIN_DATE] = min(self.days.keys())
+        stats[tk.MAX_DATE] = max(self.days.keys())
+        stats[tk.ISLAMIC_MONTHS] = list(
+            {day[tk.ISLAMIC_DATE][1] for day in self.days.values()}
+        )
+        return built
+
+
+def build_timetable(
+    name, url, config, html, charset="utf-8", previous=None, first_date=None
+):
+    """Build and cache a timetable from a whole page."""
+    builder = TimetableBuilder(name, url, config, previous, charset, first_date)
+    builder.feed(html)
+    built_timetable = builder.finish()
+    lupt_cache.cache_timetable(built_timetable)
+    return built_timetable
+
+
+def build_columns(name, url, config, html, charset="utf-8", first_date=None):
+    """Build and cache a timetable from a whole page, returning its index bytes.
+
+    Runs in a worker process, so only the compact index crosses back.
+    """
+    built_timetable = build_timetable(
+        name, url, config, html, charset, first_date=first_date
+    )
+    return TimetableIndex(built_timetable).to_bytes()
@@ -0,0 +1,166 @@
+"""Runtime performance telemetry for lupt."""
+from bisect import bisect_left
+from contextlib import contextmanager
+import functools
+import sys
+import time
+
+from .const import DOMAIN, PERF_KEY
+
+HISTOGRAM_BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500)
+
+
+def get_perf_stats(hass):
+    """Get the shared performance telemetry, creating it if needed."""
+    data = hass.data.setdefault(DOMAIN, {})
+    if PERF_KEY not in data:
+        data[PERF_KEY] = PerfStats()
+    return data[PERF_KEY]
+
+
+def timed(name):
+    """Record the latency of a method of anything holding hass under name."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                get_perf_stats(self.hass).record(name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def get_size(obj):
+    """Estimate the memory held by an object and everything it contains."""
+    seen = set()
+    pending = [obj]
+    size = 0
+    while pending:
+        item = pending.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            pending.extend(item.keys())
+            pending.extend(item.values())
+        elif isinstance(item, (list, tuple, set)):
+            pending.extend(item)
+    return size
+
+
+class LatencyHistogram:
+    """Count latencies into fixed buckets, keeping the total and maximum."""
+
+    def __init__(self):
+        """Initialise histogram."""
+        self.counts = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        """Count a latency."""
+        millis = seconds * 1000
+        self.counts[bisect_left(HISTOGRAM_BUCKETS_MS, millis)] += 1
+        self.total += millis
+        self.max = max(self.max, millis)
+
+    @property
+    def count(self):
+        """Return the number of latencies counted."""
+        return sum(self.counts)
+
+    def as_dict(self):
+        """Return the histogram, with bucket counts keyed by their upper bound."""
+        buckets = {f"<={x}ms": n for x, n in zip(HISTOGRAM_BUCKETS_MS, self.counts)}
+        buckets[f">{HISTOGRAM_BUCKETS_MS[-1]}ms"] = self.counts[-1]
+        count = self.count
+        return {
+            "count": count,
+            "mean_ms": round(self.total / count, 3) if count else None,
+            "max_ms": round(self.max, 3),
+            "buckets": buckets,
+        }
+
+
+class PerfStats:
+    """Timings of the last fetch and index build, and callback latencies."""
+
+    def __init__(self):
+        """Initialise stats."""
+        self.fetch_seconds = None
+        self.fetch_bytes = None
+        self.build_seconds = None
+        self.index_seconds = None
+        self.histograms = {}
+
+    def record(self, name, seconds):
+        """Count the latency of a callback."""
+        if name not in self.histograms:
+            self.histograms[name] = LatencyHistogram()
+        self.histograms[name].record(seconds)
+
+    def record_fetch(self, fetch_seconds, fetch_bytes, build_seconds):
+        """Store the timings of the last fetch."""
+        self.fetch_seconds = fetch_seconds
+        self.fetch_bytes = fetch_bytes
+        self.build_seconds = build_seconds
+
+    def as_dict(self):
+        """Return the stats, rounding timings to milliseconds."""
+
+        def millis(seconds):
+            return None if seconds is None else round(seconds * 1000, 3)
+
+        return {
+            "fetch_latency_ms": millis(self.fetch_seconds),
+            "fetch_bytes": self.fetch_bytes,
+            "build_ms": millis(self.build_seconds),
+            "index_build_ms": millis(self.index_seconds),
+            "callback_latency": {
+                name: histogram.as_dict()
+                for name, histogram in sorted(self.histograms.items())
+            },
+        }
+
+
+class FetchTimer:
+    """Split the time taken by a fetch between downloading and building."""
+
+    def __init__(self):
+        """Start timing."""
+        self.start = time.perf_counter()
+        self.build_seconds = 0.0
+        self.bytes = 0
+
+    def wrap(self, feed):
+        """Wrap a feed, counting the bytes fed and the time it takes."""
+
+        def timed_feed(chunk):
+            self.bytes += len(chunk)
+            start = time.perf_counter()
+            feed(chunk)
+            self.build_seconds += time.perf_counter() - start
+
+        return timed_feed
+
+    @contextmanager
+    def building(self):
+        """Count the time taken by a block as building."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.build_seconds += time.perf_counter() - start
+
+    def record(self, hass):
+        """Store this fetch's timings."""
+        elapsed = time.perf_counter() - self.start
+        get_perf_stats(hass).record_fetch(
+            elapsed - self.build_seconds, self.bytes, self.build_seconds
+        )
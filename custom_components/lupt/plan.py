@@ -0,0 +1,29 @@
+"""Day plans for lupt state transitions."""
+
+
+class DayPlan:
+    """Ordered (UTC instant, state, attributes) transitions for one local day."""
+
+    def __init__(self, steps, end):
+        """Initialise plan."""
+        self.steps = sorted(steps, key=lambda step: step[0])
+        self.end = end
+        self.cursor = 0
+
+    @property
+    def next_time(self):
+        """Return when the next step is due, or the end of the plan."""
+        if self.cursor < len(self.steps):
+            return self.steps[self.cursor][0]
+        return self.end
+
+    def is_finished(self, dt):
+        """Check whether the plan has run out by dt."""
+        return dt >= self.end
+
+    def advance(self, dt):
+        """Move past every step due by dt and return them."""
+        start = self.cursor
+        while self.cursor < len(self.steps) and self.steps[self.cursor][0] <= dt:
+            self.cursor += 1
+        return self.steps[start : self.cursor]
@@ -0,0 +1,42 @@
+"""Refresh policy for lupt timetables."""
+from datetime import timedelta
+import hashlib
+
+from homeassistant.util import dt as dt_util
+
+LOW_COVERAGE_DAYS = 30
+REFRESH_OFFSET = timedelta(minutes=15)
+
+
+def is_correction_expected(islamic_day):
+    """Check whether the Islamic date may still be corrected by a moon sighting."""
+    return islamic_day >= 29 or islamic_day == 1
+
+
+def get_refresh_interval(coverage_days, correction_expected, min_days, max_days):
+    """Work out how many days to leave between fetches.
+
+    Fetch as often as allowed while coverage is low or the Islamic date may be
+    corrected, otherwise back off towards the maximum as coverage grows.
+    """
+    if correction_expected or coverage_days <= LOW_COVERAGE_DAYS:
+        return min_days
+    return max(min_days, min(max_days, (coverage_days - LOW_COVERAGE_DAYS) // 2))
+
+
+def get_jitter(seed, window_mins):
+    """Work out a stable offset into the refresh window for an instance."""
+    if not seed or window_mins <= 0:
+        return timedelta()
+    digest = hashlib.sha256(seed.encode()).digest()
+    return timedelta(seconds=int.from_bytes(digest[:8], "big") % (window_mins * 60))
+
+
+def get_next_refresh(now, last_fetched, interval_days, jitter=timedelta()):
+    """Work out when to fetch next, jittered from a quarter past local midnight."""
+    offset = REFRESH_OFFSET + jitter
+    due = dt_util.as_local(max(now, last_fetched + timedelta(days=interval_days)))
+    next_time = dt_util.start_of_local_day(due) + offset
+    if next_time <= now:
+        next_time = dt_util.start_of_local_day(due + timedelta(days=1)) + offset
+    return dt_util.as_utc(next_time)
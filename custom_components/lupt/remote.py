@@ -0,0 +1,257 @@
+"""Remote timetable fetching for lupt."""
+import codecs
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import multiprocessing
+
+import aiohttp
+from homeassistant.core import callback
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.event import async_call_later
+
+from . import perf
+from .const import DOMAIN, POOL_KEY, PREFETCH_KEY
+from .index import TimetableIndex
+from .ingest import RowParser, build_columns, build_timetable
+
+ETAG = "etag"
+LAST_MODIFIED = "last_modified"
+DIGEST = "digest"
+
+DEFAULT_CHARSET = "utf-8"
+FETCH_TIMEOUT = 60
+PREFETCH_TTL = 300
+PROBE_ROWS = 3
+CHUNK_SIZE = 4096
+POOL_WORKERS = 1
+
+
+@callback
+def store_prefetch(hass, url, prefetch):
+    """Keep a probed page for the first fetch, for up to PREFETCH_TTL seconds.
+
+    Any page already kept for the URL is dropped.
+    """
+    drop_prefetch(hass, url)
+
+    @callback
+    def expire(now):
+        """Drop the page if the first fetch hasn't taken it."""
+        drop_prefetch(hass, url)
+
+    prefetches = hass.data.setdefault(DOMAIN, {}).setdefault(PREFETCH_KEY, {})
+    prefetches[url] = (prefetch, async_call_later(hass, PREFETCH_TTL, expire))
+
+
+@callback
+def drop_prefetch(hass, url):
+    """Drop the page kept for the URL, if any, cancelling its download."""
+    kept = hass.data.get(DOMAIN, {}).get(PREFETCH_KEY, {}).pop(url, None)
+    if kept is not None:
+        (prefetch, cancel_expiry) = kept
+        cancel_expiry()
+        discard_prefetch(prefetch)
+
+
+@callback
+def discard_prefetch(prefetch):
+    """Cancel a prefetch, or retrieve its error so it isn't logged."""
+    if not prefetch.done():
+        prefetch.cancel()
+    elif not prefetch.cancelled():
+        prefetch.exception()
+
+
+async def async_take_prefetch(hass, url):
+    """Take the page prefetched by a probe of the URL, if any."""
+    kept = hass.data.get(DOMAIN, {}).get(PREFETCH_KEY, {}).pop(url, None)
+    if kept is None:
+        return None
+    (prefetch, cancel_expiry) = kept
+    cancel_expiry()
+    try:
+        return await prefetch
+    except Exception:
+        return None
+
+
+async def async_stream_html(hass, url, validators, open_feed):
+    """Stream a timetable page into a feed, returning None if it's not modified.
+
+    The feed is opened with the page's charset once the response arrives.
+    Returns the page's validators, including a digest of its body.
+    """
+    prefetched = await async_take_prefetch(hass, url)
+    if prefetched is not None:
+        (html, headers, charset) = prefetched
+        open_feed(charset)(html)
+        return get_validators(headers, hashlib.sha256(html))
+
+    headers = {"User-Agent": "Mozilla/5.0"}
+    if validators.get(ETAG):
+        headers["If-None-Match"] = validators[ETAG]
+    if validators.get(LAST_MODIFIED):
+        headers["If-Modified-Since"] = validators[LAST_MODIFIED]
+
+    session = async_get_clientsession(hass)
+    async with session.get(
+        url, headers=headers, timeout=aiohttp.ClientTimeout(total=FETCH_TIMEOUT)
+    ) as response:
+        if response.status == 304:
+            return None
+        response.raise_for_status()
+        feed = open_feed(response.charset or DEFAULT_CHARSET)
+        digest = hashlib.sha256()
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            digest.update(chunk)
+            feed(chunk)
+        return get_validators(response.headers, digest)
+
+
+def get_validators(headers, digest):
+    """Work out the validators of a fetched page."""
+    return {
+        ETAG: headers.get("ETag"),
+        LAST_MODIFIED: headers.get("Last-Modified"),
+        DIGEST: digest.hexdigest(),
+    }
+
+
+async def async_probe_url(hass, url, css_class, num_rows=PROBE_ROWS):
+    """Stream a page until a few timetable rows have been parsed.
+
+    Returns the rows and a task that keeps downloading the rest of the page
+    in the background. Once the rows check out, the task can be kept with
+    store_prefetch so the first fetch after setup uses it instead of
+    downloading the page again. Otherwise it should be discarded.
+    """
+    session = async_get_clientsession(hass)
+    response = await session.get(
+        url,
+        headers={"User-Agent": "Mozilla/5.0"},
+        timeout=aiohttp.ClientTimeout(total=FETCH_TIMEOUT),
+    )
+    try:
+        response.raise_for_status()
+        charset = response.charset or DEFAULT_CHARSET
+        decoder = codecs.getincrementaldecoder(charset)("replace")
+        parser = RowParser(css_class)
+        stream = response.content
+        chunks = []
+        async for chunk in stream.iter_chunked(CHUNK_SIZE):
+            chunks.append(chunk)
+            parser.feed(decoder.decode(chunk))
+            if len(parser.rows) >= num_rows:
+                break
+    except Exception:
+        response.release()
+        raise
+
+    prefetch = hass.async_create_task(
+        async_finish_page(response, stream, chunks, charset)
+    )
+    return parser.rows[:num_rows], prefetch
+
+
+async def async_finish_page(response, stream, chunks, charset):
+    """Read the rest of a probed page, returning it with its headers and charset."""
+    try:
+        async for chunk in stream.iter_chunked(CHUNK_SIZE):
+            chunks.append(chunk)
+    finally:
+        response.release()
+    return b"".join(chunks), response.headers, charset
+
+
+def get_process_pool(hass):
+    """Get the process pool for building timetables, creating it if need be."""
+    data = hass.data.setdefault(DOMAIN, {})
+    if POOL_KEY not in data:
+        data[POOL_KEY] = ProcessPoolExecutor(
+            max_workers=POOL_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return data[POOL_KEY]
+
+
+def shutdown_process_pool(hass):
+    """Shut down the process pool, if there is one."""
+    pool = hass.data.get(DOMAIN, {}).pop(POOL_KEY, None)
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def async_read_page(hass, url, validators, timer):
+    """Read a page and its charset, or None if it's unchanged since validators.
+
+    Only the download runs on the event loop; the page is parsed by the
+    caller, and only once it is known to have changed. Returns the page's
+    validators too.
+    """
+    chunks = []
+    charset = None
+
+    def open_chunks(page_charset):
+        nonlocal charset
+        charset = page_charset
+        return timer.wrap(chunks.append)
+
+    new_validators = await async_stream_html(hass, url, validators, open_chunks)
+    if new_validators is None:
+        return None, charset, validators
+    if new_validators[DIGEST] == validators.get(DIGEST):
+        return None, charset, new_validators
+    return b"".join(chunks), charset, new_validators
+
+
+async def async_build_in_pool(
+    hass, pool, name, url, config, validators, timer, first_date=None
+):
+    """Fetch a page, then build and cache its timetable in a worker process.
+
+    Returns the index of the timetable, rather than the timetable itself.
+    """
+    (html, charset, new_validators) = await async_read_page(
+        hass, url, validators, timer
+    )
+    if html is None:
+        return None, new_validators
+
+    with timer.building():
+        buffer = await hass.loop.run_in_executor(
+            pool, build_columns, name, url, config, html, charset, first_date
+        )
+        index = TimetableIndex.from_bytes(buffer)
+    return index, new_validators
+
+
+async def async_init_timetable(
+    hass, name, url, config, validators, previous=None, pool=None, first_date=None
+):
+    """Build and cache a timetable, or return None if the remote is unchanged.
+
+    A changed page is built in the executor, reusing the days of previous for
+    rows that have not changed and skipping rows before first_date. Given a
+    process pool, the page is built there instead and the index of the
+    timetable is returned in its place. The time spent downloading, the bytes
+    downloaded and the time spent building are recorded either way.
+    """
+    timer = perf.FetchTimer()
+    try:
+        if pool is not None:
+            return await async_build_in_pool(
+                hass, pool, name, url, config, validators, timer, first_date
+            )
+
+        (html, charset, new_validators) = await async_read_page(
+            hass, url, validators, timer
+        )
+        if html is None:
+            return None, new_validators
+
+        with timer.building():
+            built_timetable = await hass.async_add_executor_job(
+                build_timetable, name, url, config, html, charset, previous, first_date
+            )
+        return built_timetable, new_validators
+    finally:
+        timer.record(hass)
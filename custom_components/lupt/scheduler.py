@@ -0,0 +1,180 @@
+"""Shared scheduler for lupt triggers."""
+import heapq
+import itertools
+import logging
+
+from homeassistant.core import callback
+from homeassistant.helpers import event
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+
+from .const import DOMAIN, SCHEDULER_KEY, SIGNAL_TIMETABLE_UPDATED
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def get_scheduler(hass):
+    """Get the shared scheduler, creating it if needed."""
+    data = hass.data.setdefault(DOMAIN, {})
+    if SCHEDULER_KEY not in data:
+        data[SCHEDULER_KEY] = LuptScheduler(hass)
+    return data[SCHEDULER_KEY]
+
+
+class LuptScheduler:
+    """Multiplex every listener onto a single Home Assistant timer."""
+
+    def __init__(self, hass):
+        """Initialise scheduler."""
+        self.hass = hass
+        self._heap = []
+        self._counter = itertools.count()
+        self._pending = 0
+        self._unsub = None
+        self._armed_time = None
+        self._dispatching = False
+        self._stopped = False
+        self._listeners = {}
+        self.unsub_timetable = async_dispatcher_connect(
+            hass, SIGNAL_TIMETABLE_UPDATED, self._handle_timetable
+        )
+
+    def __len__(self):
+        """Return the number of pending fire times, including cancelled ones."""
+        return len(self._heap)
+
+    @property
+    def num_pending(self):
+        """Return the number of pending fire times that are still live."""
+        return self._pending
+
+    @callback
+    def async_stop(self):
+        """Cancel the timer until started again, keeping every listener.
+
+        Listeners belong to automations, which outlive a config entry.
+        """
+        self._stopped = True
+        self._armed_time = None
+        if self._unsub:
+            self._unsub()
+            self._unsub = None
+
+    @callback
+    def async_start(self):
+        """Reschedule every listener from now and arm the timer."""
+        self._stopped = False
+        self._dispatching = True
+        try:
+            for listeners in self._listeners.values():
+                for listener in listeners:
+                    listener.async_reschedule()
+        finally:
+            self._dispatching = False
+            self._arm()
+
+    @callback
+    def async_register(self, listener):
+        """Track a listener so timetable changes can reach it."""
+        self._listeners.setdefault(listener.event, set()).add(listener)
+
+    @callback
+    def async_unregister(self, listener):
+        """Stop tracking a listener."""
+        self._listeners.get(listener.event, set()).discard(listener)
+
+    @callback
+    def async_schedule(self, listener, fire_time):
+        """Schedule a listener and return a callback to cancel it."""
+        entry = [fire_time, next(self._counter), listener]
+        heapq.heappush(self._heap, entry)
+        self._pending += 1
+        self._arm()
+
+        @callback
+        def cancel():
+            """Cancel the scheduled listener."""
+            if entry[2] is not None:
+                entry[2] = None
+                self._pending -= 1
+            self._arm()
+
+        return cancel
+
+    @callback
+    def _arm(self):
+        """Make sure the timer points at the nearest live deadline."""
+        if self._dispatching or self._stopped:
+            return
+
+        while self._heap and self._heap[0][2] is None:
+            heapq.heappop(self._heap)
+
+        next_time = self._heap[0][0] if self._heap else None
+        if next_time == self._armed_time:
+            return
+
+        if self._unsub:
+            self._unsub()
+            self._unsub = None
+
+        self._armed_time = next_time
+        if next_time is not None:
+            _LOGGER.debug(f"Scheduling next trigger dispatch for {next_time}")
+            self._unsub = event.async_track_point_in_utc_time(
+                self.hass, self._handle_timer, next_time
+            )
+
+    @callback
+    def _handle_timer(self, now):
+        """Dispatch every listener due at this instant."""
+        self._unsub = None
+        self._armed_time = None
+        self._dispatching = True
+        try:
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                entry = heapq.heappop(self._heap)
+                if entry[2] is not None:
+                    due.append(entry[2])
+                    entry[2] = None
+                    self._pending -= 1
+
+            _LOGGER.info(f"Dispatching {len(due)} LUPT listeners.")
+            for listener in due:
+                listener._handle_event(now)
+        finally:
+            self._dispatching = False
+            self._arm()
+
+    @callback
+    def _handle_timetable(self, version, changes):
+        """Reschedule only the listeners whose next fire time has changed.
+
+        Without changes the timetable is the first one, so every listener
+        still waiting for one is scheduled.
+        """
+        if changes is None:
+            affected = [
+                listener
+                for listeners in self._listeners.values()
+                for listener in listeners
+                if listener.next_time is None
+            ]
+        else:
+            affected = [
+                listener
+                for label, cells in changes.items()
+                for listener in self._listeners.get(label, ())
+                if listener.is_affected(cells)
+            ]
+
+        _LOGGER.info(
+            f"Timetable version {version} reschedules {len(affected)} LUPT listeners."
+        )
+        self._dispatching = True
+        try:
+            for listener in affected:
+                listener.async_reschedule()
+        finally:
+            self._dispatching = False
+            self._arm()
@@ -0,0 +1,186 @@
+"""Sensors for lupt."""
+from homeassistant.components.sensor import SensorEntity
+from homeassistant.const import DEVICE_CLASS_TIMESTAMP, TIME_MILLISECONDS
+from homeassistant.core import callback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from homeassistant.util import dt as dt_util
+
+from .const import (
+    DOMAIN,
+    NAME,
+    SIGNAL_UPDATE,
+    STATE_ATTR_ISLAMIC_DATE,
+    STATE_ATTR_ISLAMIC_DAY,
+    STATE_ATTR_ISLAMIC_MONTH,
+    STATE_ATTR_ISLAMIC_YEAR,
+    STATE_ATTR_LAST_UPDATED,
+    STATE_ATTR_MAX_DATE,
+    STATE_ATTR_MIN_DATE,
+    STATE_ATTR_NUM_DATES,
+)
+
+# Fetch stats that only change with the state of the download, not its counts
+FETCH_STATE_ATTRS = ["fetch_circuit", "fetch_last_error", "fetch_last_success"]
+
+
+async def async_setup_entry(hass, entry, async_add_entities):
+    """Set up lupt sensors from a config entry."""
+    lupt = hass.data[DOMAIN][entry.entry_id]
+    sensors = [LuptNextTimeSensor(lupt, entry.entry_id, x) for x in lupt.times]
+    sensors.append(LuptIslamicDateSensor(lupt, entry.entry_id))
+    sensors.append(LuptDiagnosticsSensor(lupt, entry.entry_id))
+    if lupt.performance_sensor:
+        sensors.append(LuptPerformanceSensor(lupt, entry.entry_id))
+    async_add_entities(sensors)
+
+
+class LuptSensor(SensorEntity):
+    """Sensor following one part of the main lupt entity.
+
+    Subclasses provide calculate(), returning the value and attributes.
+    """
+
+    def __init__(self, lupt, entry_id, key, name):
+        """Initialise sensor."""
+        self.lupt = lupt
+        self._unique_id = f"{entry_id}_{key}"
+        self._name = f"{NAME} {name}"
+        self._value = None
+        self._attrs = {}
+
+    @property
+    def name(self):
+        """Friendly name."""
+        return self._name
+
+    @property
+    def unique_id(self):
+        """Unique ID."""
+        return self._unique_id
+
+    @property
+    def should_poll(self):
+        """Updates are pushed by lupt."""
+        return False
+
+    @property
+    def native_value(self):
+        """State."""
+        return self._value
+
+    @property
+    def extra_state_attributes(self):
+        """Extra HomeAssistant attributes."""
+        return self._attrs
+
+    async def async_added_to_hass(self):
+        """Follow lupt updates."""
+        (self._value, self._attrs) = self.calculate()
+        self.async_on_remove(
+            async_dispatcher_connect(self.hass, SIGNAL_UPDATE, self.async_update_value)
+        )
+
+    @callback
+    def async_update_value(self):
+        """Write state only if the value or attributes changed."""
+        (value, attrs) = self.calculate()
+        if value == self._value and attrs == self._attrs:
+            return
+        (self._value, self._attrs) = (value, attrs)
+        self.async_write_ha_state()
+
+
+class LuptNextTimeSensor(LuptSensor):
+    """Next time of a prayer."""
+
+    def __init__(self, lupt, entry_id, prayer):
+        """Initialise sensor."""
+        self.attribute = lupt.next_time_attribute(prayer)
+        super().__init__(
+            lupt, entry_id, self.attribute, f"Next {lupt.format_prayer(prayer)}"
+        )
+
+    @property
+    def device_class(self):
+        """Timestamp."""
+        return DEVICE_CLASS_TIMESTAMP
+
+    def calculate(self):
+        """Calculate the value and attributes from lupt."""
+        next_time = self.lupt.extra_state_attributes.get(self.attribute)
+        return (next_time and dt_util.parse_datetime(next_time), {})
+
+
+class LuptIslamicDateSensor(LuptSensor):
+    """Islamic date."""
+
+    def __init__(self, lupt, entry_id):
+        """Initialise sensor."""
+        super().__init__(lupt, entry_id, STATE_ATTR_ISLAMIC_DATE, "Islamic Date")
+
+    def calculate(self):
+        """Calculate the value and attributes from lupt."""
+        attrs = self.lupt.extra_state_attributes
+        return (
+            attrs.get(STATE_ATTR_ISLAMIC_DATE),
+            {
+                x: attrs.get(x)
+                for x in [
+                    STATE_ATTR_ISLAMIC_YEAR,
+                    STATE_ATTR_ISLAMIC_MONTH,
+                    STATE_ATTR_ISLAMIC_DAY,
+                ]
+            },
+        )
+
+
+class LuptDiagnosticsSensor(LuptSensor):
+    """Timetable diagnostics."""
+
+    def __init__(self, lupt, entry_id):
+        """Initialise sensor."""
+        super().__init__(lupt, entry_id, "diagnostics", "Timetable")
+
+    @property
+    def device_class(self):
+        """Timestamp."""
+        return DEVICE_CLASS_TIMESTAMP
+
+    def calculate(self):
+        """Calculate the value and attributes from lupt.
+
+        Counters move with every fetch and flush, so they are left to the
+        diagnostics rather than written to the recorder each time.
+        """
+        attrs = self.lupt.extra_state_attributes
+        last_updated = attrs.get(STATE_ATTR_LAST_UPDATED)
+        diagnostics = {
+            x: attrs.get(x)
+            for x in [STATE_ATTR_MIN_DATE, STATE_ATTR_MAX_DATE, STATE_ATTR_NUM_DATES]
+        }
+        fetch_stats = self.lupt.get_fetch_stats()
+        diagnostics.update({x: fetch_stats[x] for x in FETCH_STATE_ATTRS})
+        return (last_updated and dt_util.parse_datetime(last_updated), diagnostics)
+
+
+class LuptPerformanceSensor(LuptSensor):
+    """Performance diagnostics."""
+
+    def __init__(self, lupt, entry_id):
+        """Initialise sensor."""
+        super().__init__(lupt, entry_id, "performance", "Performance")
+
+    @property
+    def native_unit_of_measurement(self):
+        """Milliseconds."""
+        return TIME_MILLISECONDS
+
+    def calculate(self):
+        """Calculate the last fetch latency and other telemetry from lupt.
+
+        Callback latencies change on every update, so they are left to the
+        diagnostics rather than written to the recorder each time.
+        """
+        stats = self.lupt.get_perf_stats()
+        del stats["callback_latency"]
+        return (stats.pop("fetch_latency_ms"), stats)
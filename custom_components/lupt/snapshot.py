@@ -0,0 +1,106 @@
+"""Memory-mapped timetable snapshots for lupt."""
+import json
+import mmap
+import os
+import struct
+
+from homeassistant.helpers.storage import STORAGE_DIR
+from london_unified_prayer_times import constants as lupt_constants
+
+from .const import DOMAIN
+from .index import TimetableIndex
+
+tk = lupt_constants.TimetableKeys
+
+SNAPSHOT_FILE = f"{DOMAIN}.snapshot"
+ARCHIVE_DIR = f"{DOMAIN}_archive"
+VALIDATORS = struct.Struct("<I")
+
+
+def get_snapshot_path(hass):
+    """Get where the timetable snapshot is kept."""
+    return hass.config.path(STORAGE_DIR, SNAPSHOT_FILE)
+
+
+def write_snapshot(path, index, validators=None):
+    """Write an index to a snapshot, replacing any previous one atomically.
+
+    The validators of the page the index was built from are written ahead
+    of it, padded so the index columns stay aligned.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    meta = json.dumps(validators or {}).encode()
+    padding = -(VALIDATORS.size + len(meta)) % 4
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as snapshot_file:
+        snapshot_file.write(VALIDATORS.pack(len(meta)) + meta + bytes(padding))
+        snapshot_file.write(index.to_bytes())
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+    os.replace(temp_path, path)
+
+
+def open_snapshot(path):
+    """Open a snapshot as an index whose columns are read from the mapped file."""
+    return open_snapshot_with_validators(path)[0]
+
+
+def open_snapshot_with_validators(path):
+    """Open a snapshot as an index and the validators it was written with."""
+    with open(path, "rb") as snapshot_file:
+        mapped = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    (length,) = VALIDATORS.unpack_from(view)
+    offset = VALIDATORS.size + length
+    if offset > len(view):
+        raise ValueError("Truncated or corrupt snapshot")
+    validators = json.loads(str(view[VALIDATORS.size : offset], "utf-8"))
+    offset += -offset % 4
+    return TimetableIndex.from_bytes(view[offset:]), validators
+
+
+def get_archive_dir(hass):
+    """Get where yearly archives of pruned days are kept."""
+    return hass.config.path(STORAGE_DIR, ARCHIVE_DIR)
+
+
+def get_archive_path(archive_dir, year):
+    """Get the archive snapshot for a year."""
+    return os.path.join(archive_dir, f"{year}.snapshot")
+
+
+def archive_days(archive_dir, days, last_updated):
+    """Add days to their yearly archive snapshots, replacing any already there."""
+    years = {}
+    for dt, day in days.items():
+        years.setdefault(dt.year, {})[dt] = day
+
+    for year, year_days in years.items():
+        path = get_archive_path(archive_dir, year)
+        archived = {}
+        archive = open_archive(archive_dir, year)
+        if archive is not None:
+            archived = archive.to_timetable(DOMAIN, path, None)[tk.DATES]
+        archived.update(year_days)
+        index = TimetableIndex(
+            {tk.STATS: {tk.LAST_UPDATED: last_updated}, tk.DATES: archived}
+        )
+        write_snapshot(path, index)
+
+
+def open_archive(archive_dir, year):
+    """Open the archive snapshot for a year, or return None if there isn't one."""
+    path = get_archive_path(archive_dir, year)
+    if not os.path.exists(path):
+        return None
+    return open_snapshot(path)
+
+
+def archive_index(archive_dir, index, first_date):
+    """Add the days of an index before first_date to their yearly archives."""
+    days = index.to_timetable(DOMAIN, archive_dir, None)[tk.DATES]
+    archive_days(
+        archive_dir,
+        {dt: day for dt, day in days.items() if dt < first_date},
+        index.last_updated,
+    )
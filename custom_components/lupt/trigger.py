@@ -4,13 +4,13 @@ import logging
 
 from homeassistant.const import CONF_EVENT, CONF_OFFSET, CONF_PLATFORM
 from homeassistant.core import HassJob, callback
-from homeassistant.helpers import event
 import homeassistant.helpers.config_validation as cv
 from homeassistant.util import dt as dt_util
-from london_unified_prayer_times import query as lupt_query
 import voluptuous as vol
 
-from .const import CACHED_KEY, DOMAIN
+from . import perf
+from .const import DOMAIN, INDEX_KEY
+from .scheduler import get_scheduler
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -64,30 +64,57 @@ class LuptListener:
         self.job = job
         self.event = event
         self.offset = offset
+        self.next_time = None
         self._unsub = None
 
-    def get_cached_timetable(self):
-        """Retrieve cached timetable from hass."""
-        return self.hass.data[DOMAIN][CACHED_KEY]
+    def get_cached_index(self):
+        """Retrieve cached timetable index from hass."""
+        return self.hass.data[DOMAIN][INDEX_KEY]
 
     @callback
     def async_attach(self) -> None:
         """Attach listener."""
         _LOGGER.info("Attaching listener.")
+        get_scheduler(self.hass).async_register(self)
         self._listen_next_event()
 
     @callback
     def async_detach(self) -> None:
         """Detach listener."""
         _LOGGER.info("Detaching listener.")
-        self._unsub()
+        get_scheduler(self.hass).async_unregister(self)
+        if self._unsub:
+            self._unsub()
         self._unsub = None
 
+    @callback
+    def async_reschedule(self) -> None:
+        """Recalculate the next event after a timetable change."""
+        if self._unsub:
+            self._unsub()
+        self._unsub = None
+        self._listen_next_event()
+
+    def is_affected(self, cells):
+        """Check whether changed (date, old, new) cells move the next event."""
+        now = (dt_util.utcnow() - self.offset).timestamp() / 60
+        pending = None
+        if self.next_time:
+            pending = (self.next_time - self.offset).timestamp() / 60
+
+        for (_, old, new) in cells:
+            if pending is None:
+                if new is not None:
+                    return True
+            elif old == pending or (new is not None and now < new < pending):
+                return True
+        return False
+
     def calculate_next_time(self, dt):
         """Calculate the next trigger time."""
         original_event_time = dt - self.offset
-        nandn = lupt_query.get_now_and_next(
-            self.get_cached_timetable(), [self.event], original_event_time
+        nandn = self.get_cached_index().get_now_and_next(
+            [self.event], original_event_time
         )
         next_time = nandn[1][1] + self.offset
         return dt_util.as_utc(next_time)
@@ -96,15 +123,23 @@ class LuptListener:
     def _listen_next_event(self) -> None:
         """Set up the listener."""
 
+        self.next_time = None
+        if INDEX_KEY not in self.hass.data.get(DOMAIN, {}):
+            _LOGGER.info(f"Waiting for a timetable to schedule {self.event} events.")
+            return
+
         dt = dt_util.utcnow()
-        next_time = self.calculate_next_time(dt)
+        try:
+            self.next_time = self.calculate_next_time(dt)
+        except KeyError:
+            _LOGGER.warning(f"No more {self.event} events in the timetable.")
+            return
 
-        _LOGGER.info(f"Scheduling next event for {next_time.isoformat()}")
-        self._unsub = event.async_track_point_in_utc_time(
-            self.hass, self._handle_event, next_time
-        )
+        _LOGGER.info(f"Scheduling next event for {self.next_time.isoformat()}")
+        self._unsub = get_scheduler(self.hass).async_schedule(self, self.next_time)
 
     @callback
+    @perf.timed("trigger_event")
     def _handle_event(self, now) -> None:
         """Handle event."""
         _LOGGER.info("Triggering LUPT job.")
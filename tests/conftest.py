@@ -19,6 +19,16 @@ def auto_enable_custom_integrations(enable_custom_integrations):
     yield
 
 
+@pytest.fixture(autouse=True)
+def snapshot_path(tmp_path, mocker):
+    """Keep timetable snapshots out of the shared test config dir."""
+    path = str(tmp_path / "lupt.snapshot")
+    mocker.patch(
+        "custom_components.lupt.snapshot." + "get_snapshot_path", return_value=path
+    )
+    return path
+
+
 @pytest.fixture
 def three_unsorted_days():
     """Sample data with which to build a valid timetable."""
@@ -122,8 +132,12 @@ def start_dt():
 def lupt_mock_good_load(three_day_timetable, start_dt, mocker):
     """Mock lupt functions."""
     mocker.patch(
-        "custom_components.lupt.lupt_cache." + "init_timetable",
-        return_value=three_day_timetable,
+        "custom_components.lupt.remote." + "async_init_timetable",
+        return_value=(three_day_timetable, {}),
+    )
+    mocker.patch(
+        "custom_components.lupt.lupt_cache." + "load_cached_timetable",
+        side_effect=FileNotFoundError,
     )
     mocker.patch("custom_components.lupt.dt_util.utcnow", return_value=start_dt)
 
@@ -132,11 +146,11 @@ def lupt_mock_good_load(three_day_timetable, start_dt, mocker):
 def lupt_mock_bad_load(three_day_timetable, start_dt, mocker):
     """Mock lupt functions."""
     mocker.patch(
-        "custom_components.lupt.lupt_cache." + "init_timetable",
+        "custom_components.lupt.remote." + "async_init_timetable",
         side_effect=Exception,
     )
     mocker.patch(
-        "custom_components.lupt.lupt_cache." + "load_timetable",
+        "custom_components.lupt.lupt_cache." + "load_cached_timetable",
         return_value=three_day_timetable,
     )
     mocker.patch("custom_components.lupt.dt_util.utcnow", return_value=start_dt)
@@ -189,9 +203,10 @@ def calls(hass):
 def config_flow_good_remote(three_day_timetable, mocker):
     """Mock lupt functions."""
     mocker.patch(
-        "custom_components.lupt.config_flow.remote_data." + "get_html_data",
-        return_value={},
+        "custom_components.lupt.config_flow.remote." + "async_probe_url",
+        return_value=([], None),
     )
+    mocker.patch("custom_components.lupt.config_flow.remote." + "store_prefetch")
     mocker.patch(
         "custom_components.lupt.config_flow.timetable." + "build_timetable",
         return_value=three_day_timetable,
@@ -202,7 +217,7 @@ def config_flow_good_remote(three_day_timetable, mocker):
 def config_flow_bad_remote(three_day_timetable, mocker):
     """Mock lupt functions."""
     mocker.patch(
-        "custom_components.lupt.config_flow.remote_data." + "get_html_data",
+        "custom_components.lupt.config_flow.remote." + "async_probe_url",
         side_effect=Exception,
     )
 
@@ -0,0 +1,113 @@
+"""Replay the integration through simulated time on a fake clock."""
+from collections import defaultdict
+import heapq
+import inspect
+import itertools
+import time
+
+from homeassistant.const import EVENT_STATE_CHANGED
+from homeassistant.core import HassJob, callback
+
+from custom_components.lupt.const import ENTITY_ID
+from custom_components.lupt.trigger import LuptListener
+
+
+class Replay:
+    """Drive lupt through simulated time, firing its timers in order.
+
+    While patched in, utcnow reads the fake clock and every point in time
+    tracked with async_track_point_in_utc_time is queued here rather than on
+    the event loop. Running the replay fires them in time order, advancing
+    the clock to each, and records what ran, what it cost, how the sensor's
+    state moved and when each attached trigger fired.
+    """
+
+    def __init__(self, hass, start):
+        """Initialise replay at the start time."""
+        self.hass = hass
+        self.now = start
+        self.fired = []
+        self.transitions = []
+        self.triggers = defaultdict(list)
+        self.fire_started = None
+        self._timers = []
+        self._counter = itertools.count()
+
+    def patch(self, mocker):
+        """Patch the clock and point in time tracking.
+
+        Plain functions are patched in rather than mocks, whose call
+        recording would swamp what's being measured.
+        """
+        mocker.patch("homeassistant.util.dt.utcnow", new=self.utcnow)
+        mocker.patch(
+            "homeassistant.helpers.event.async_track_point_in_utc_time",
+            new=self.async_track_point_in_utc_time,
+        )
+        self.hass.bus.async_listen(EVENT_STATE_CHANGED, self._handle_state_changed)
+
+    def utcnow(self):
+        """Return the simulated time."""
+        return self.now
+
+    @callback
+    def async_track_point_in_utc_time(self, hass, action, point_in_time):
+        """Queue an action for a point in time, returning a cancel callback."""
+        entry = [point_in_time, next(self._counter), action]
+        heapq.heappush(self._timers, entry)
+
+        @callback
+        def cancel():
+            """Cancel the queued action."""
+            entry[2] = None
+
+        return cancel
+
+    def attach_listener(self, event, offset):
+        """Attach a listener recording when it fires."""
+        key = (event, offset)
+        listener = LuptListener(
+            self.hass,
+            HassJob(callback(lambda: self.triggers[key].append(self.now))),
+            event,
+            offset,
+        )
+        listener.async_attach()
+        return listener
+
+    def __len__(self):
+        """Return the number of live timers."""
+        return sum(1 for x in self._timers if x[2] is not None)
+
+    async def async_run_until(self, end):
+        """Fire every timer due up to end, in order, then move the clock to end."""
+        while self._timers and self._timers[0][0] <= end:
+            (point, _, action) = heapq.heappop(self._timers)
+            if action is None:
+                continue
+            self.now = point
+            self.fire_started = time.perf_counter()
+            result = action(point)
+            if inspect.isawaitable(result):
+                await result
+            cost = time.perf_counter() - self.fire_started
+            self.fired.append((point, action.__qualname__, cost))
+            await self.hass.async_block_till_done()
+        self.now = end
+
+    def get_costs(self):
+        """Total the cost of the fired timers by action."""
+        costs = defaultdict(float)
+        for (_, name, cost) in self.fired:
+            costs[name] += cost
+        return dict(costs)
+
+    @callback
+    def _handle_state_changed(self, event):
+        """Record changes to the sensor's state."""
+        if event.data["entity_id"] != ENTITY_ID:
+            return
+        old_state = event.data["old_state"]
+        new_state = event.data["new_state"]
+        if old_state is None or old_state.state != new_state.state:
+            self.transitions.append((self.now, new_state.state))
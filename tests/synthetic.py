@@ -0,0 +1,150 @@
+"""Synthetic timetables shaped like the real page, for tests and benchmarks."""
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+import math
+from zoneinfo import ZoneInfo
+
+from london_unified_prayer_times import config as lupt_config, timetable
+
+START_DATE = date(2021, 10, 1)
+ISLAMIC_EPOCH = (date(2021, 8, 9), 1443)
+ISLAMIC_MONTHS = [
+    "Muharram",
+    "Safar",
+    "Rabi al-Awwal",
+    "Rabi al-Thani",
+    "Jumada al-Ula",
+    "Jumada al-Akhirah",
+    "Rajab",
+    "Shaban",
+    "Ramadan",
+    "Shawwal",
+    "Dhu al-Qadah",
+    "Dhu al-Hijjah",
+]
+
+UTC = ZoneInfo("UTC")
+LONDON = ZoneInfo("Europe/London")
+
+
+def get_solar_times(day):
+    """Work out rough London prayer times in UTC minutes after midnight.
+
+    Day length and the equation of time follow the seasons closely enough
+    for Zuhr to fall either side of noon, and for the local clock to cross
+    both DST changes.
+    """
+    angle = 2 * math.pi * (day.timetuple().tm_yday - 80) / 365.25
+    noon = 12 * 60 - 2 - 8 * math.sin(2 * angle)
+    half_day = 366 + 132 * math.sin(angle)
+    dawn = 80 + 40 * math.sin(angle)
+    sunrise = noon - half_day
+    maghrib = noon + half_day + 2
+    asr = noon + half_day * 0.55
+    return {
+        "Fajr Begins": sunrise - dawn,
+        "Fajr Jamā'ah": sunrise - dawn + 20,
+        "Sunrise": sunrise,
+        "Zuhr Begins": noon + 5,
+        "Zuhr Jamā'ah": noon + 35,
+        "Asr Mithl 1": asr,
+        "Asr Mithl 2": asr + 45,
+        "Asr Jamā'ah": asr + 55,
+        "Maghrib Begins": maghrib,
+        "Maghrib Jamā'ah": maghrib + 7,
+        "Ishā Begins": maghrib + 75,
+        "Ishā Jamā'ah": maghrib + 90,
+    }
+
+
+def format_time(day, minutes):
+    """Format UTC minutes after midnight as the page's local 12 hour h:mm.
+
+    Like the real page, afternoon times drop their 12 hours, leaving the
+    library to work out which are PM.
+    """
+    utc = datetime.combine(day, datetime.min.time(), UTC)
+    local = (utc + timedelta(minutes=int(minutes))).astimezone(LONDON)
+    hour = local.hour - 12 if local.hour > 12 else local.hour
+    return f"{hour}:{local.minute:02}"
+
+
+def get_month_lengths(month_lengths=None):
+    """Yield Islamic month lengths from the epoch, alternating 30 and 29 days.
+
+    Any month_lengths given are used first, for forcing rollovers.
+    """
+    yield from month_lengths or []
+    months = len(month_lengths or [])
+    while True:
+        yield 30 - months % 2
+        months += 1
+
+
+def generate_rows(num_days, start=START_DATE, month_lengths=None):
+    """Generate page rows for num_days from start.
+
+    Islamic dates are counted from 1 Muharram at ISLAMIC_EPOCH, so the same
+    Gregorian date always gets the same Islamic date for the same month
+    lengths.
+    """
+    (epoch, iyear) = ISLAMIC_EPOCH
+    if start < epoch:
+        raise ValueError(f"Synthetic timetables start from {epoch}")
+    lengths = get_month_lengths(month_lengths)
+    imonth = 0
+    length = next(lengths)
+    iday = (start - epoch).days + 1
+    while iday > length:
+        iday -= length
+        length = next(lengths)
+        (imonth, iyear) = ((imonth + 1) % 12, iyear + (imonth == 11))
+
+    rows = []
+    for offset in range(num_days):
+        day = start + timedelta(days=offset)
+        row = {
+            "Gregorian date": day.strftime("%d/%m/%Y"),
+            "Islamic day": str(iday),
+            "Islamic month": ISLAMIC_MONTHS[imonth],
+            "Islamic year": str(iyear),
+        }
+        for label, minutes in get_solar_times(day).items():
+            row[label] = format_time(day, minutes)
+        rows.append(row)
+
+        iday += 1
+        if iday > length:
+            iday = 1
+            length = next(lengths)
+            (imonth, iyear) = ((imonth + 1) % 12, iyear + (imonth == 11))
+    return rows
+
+
+def build_html(rows):
+    """Build a page holding rows like the real timetable."""
+    headings = "".join(f"<th>{x}</th>" for x in rows[0])
+    body = "".join(
+        "<tr>" + "".join(f"<td>{x}</td>" for x in row.values()) + "</tr>"
+        for row in rows
+    )
+    return (
+        '<html><body><section class="other"><table><tr><td>x</td></tr></table>'
+        '</section><section class="Prayerdata"><table>'
+        f"<thead><tr>{headings}</tr></thead><tbody>{body}</tbody>"
+        "</table></section></body></html>"
+    ).encode()
+
+
+@lru_cache(maxsize=None)
+def build_synthetic_timetable(num_days, start=START_DATE):
+    """Build (once) a library timetable of num_days from start.
+
+    The result is shared, so callers must not change it.
+    """
+    return timetable.build_timetable(
+        "synthetic",
+        "synthetic.py",
+        lupt_config.default_config(),
+        generate_rows(num_days, start),
+    )
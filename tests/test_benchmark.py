@@ -0,0 +1,169 @@
+"""Benchmark the integration's hot paths across timetable sizes.
+
+These only run with LUPT_BENCHMARK=1. Timings are compared against the
+baselines in benchmark_baselines.json, failing when one is more than
+LUPT_BENCHMARK_TOLERANCE (default 3) times slower. Run with
+LUPT_BENCHMARK_RECORD=1 as well to record new baselines instead.
+
+Baselines are absolute timings, so they only hold for the host that recorded
+them. They are stored with its name, and skipped on any other host until
+they are recorded again there.
+"""
+from datetime import timedelta
+import json
+import os
+from pathlib import Path
+import platform
+import statistics
+import time
+from unittest.mock import patch
+
+from homeassistant.core import HassJob, callback
+from london_unified_prayer_times import constants as lupt_constants
+import pytest
+
+from custom_components.lupt.trigger import LuptListener
+
+from .conftest import URL, set_up_mock
+from .synthetic import build_html, build_synthetic_timetable, generate_rows
+
+tk = lupt_constants.TimetableKeys
+
+pytestmark = [
+    pytest.mark.benchmark,
+    pytest.mark.skipif(
+        not os.environ.get("LUPT_BENCHMARK"), reason="set LUPT_BENCHMARK=1 to run"
+    ),
+]
+
+BASELINES = Path(__file__).with_name("benchmark_baselines.json")
+TOLERANCE = float(os.environ.get("LUPT_BENCHMARK_TOLERANCE", 3))
+RECORD = bool(os.environ.get("LUPT_BENCHMARK_RECORD"))
+HOST = platform.node()
+
+SIZES = {"3d": 3, "1y": 365, "10y": 3652}
+SAMPLES = 200
+REPEAT = 5
+
+
+@pytest.fixture(scope="module")
+def baselines():
+    """Load the baselines recorded on this host, writing them back if recording."""
+    recorded = json.loads(BASELINES.read_text()) if BASELINES.exists() else {}
+    timings = recorded.get("timings", {}) if recorded.get("host") == HOST else {}
+    yield timings
+    if RECORD:
+        recorded = {"host": HOST, "timings": timings}
+        BASELINES.write_text(json.dumps(recorded, indent=2, sort_keys=True) + "\n")
+
+
+@pytest.fixture(params=SIZES.items(), ids=list(SIZES))
+def sized(request):
+    """Give the name and synthetic timetable of each size."""
+    (name, num_days) = request.param
+    return name, build_synthetic_timetable(num_days)
+
+
+def get_sample_times(timetable):
+    """Spread sample times over the days with a day either side."""
+    stats = timetable[tk.STATS]
+    first = min(timetable[tk.DATES][stats[tk.MIN_DATE]][tk.TIMES].values())
+    last = min(timetable[tk.DATES][stats[tk.MAX_DATE]][tk.TIMES].values())
+    start = first + timedelta(days=1)
+    step = (last - timedelta(days=1) - start) / SAMPLES
+    return [start + step * i for i in range(SAMPLES)]
+
+
+def measure(func, samples):
+    """Time func over the samples, giving the median seconds per call."""
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        for sample in samples:
+            func(sample)
+        timings.append((time.perf_counter() - start) / len(samples))
+    return statistics.median(timings)
+
+
+def check(baselines, name, seconds):
+    """Record a timing or compare it against its baseline."""
+    print(f"{name}: {seconds * 1e6:.1f}us")
+    if RECORD:
+        baselines[name] = seconds
+        return
+    baseline = baselines.get(name)
+    if baseline is None:
+        pytest.skip(f"No baseline for {name} recorded on {HOST}")
+    assert seconds <= baseline * TOLERANCE, (
+        f"{name} regressed: {seconds * 1e6:.1f}us against a baseline of "
+        f"{baseline * 1e6:.1f}us"
+    )
+
+
+def test_calculate_prayer_time(hass, config, sized, baselines):
+    """Benchmark working out the current prayer."""
+    (name, timetable) = sized
+    lupt = set_up_mock(hass, timetable, config)
+    seconds = measure(lupt.calculate_prayer_time, get_sample_times(timetable))
+    check(baselines, f"calculate_prayer_time[{name}]", seconds)
+
+
+def test_calculate_next_prayer_time(hass, config, sized, baselines):
+    """Benchmark working out the next time of a prayer."""
+    (name, timetable) = sized
+    lupt = set_up_mock(hass, timetable, config)
+    seconds = measure(
+        lambda dt: lupt.calculate_next_prayer_time("Maghrib Begins", dt),
+        get_sample_times(timetable),
+    )
+    check(baselines, f"calculate_next_prayer_time[{name}]", seconds)
+
+
+def test_calculate_islamic_date(hass, config, sized, baselines):
+    """Benchmark working out the Islamic date."""
+    (name, timetable) = sized
+    lupt = set_up_mock(hass, timetable, config)
+    seconds = measure(lupt.calculate_islamic_date, get_sample_times(timetable))
+    check(baselines, f"calculate_islamic_date[{name}]", seconds)
+
+
+def test_calculate_next_time(hass, config, sized, baselines):
+    """Benchmark working out when a trigger next fires."""
+    (name, timetable) = sized
+    set_up_mock(hass, timetable, config)
+    listener = LuptListener(
+        hass, HassJob(callback(lambda: None)), "Sunrise", timedelta(minutes=-10)
+    )
+    seconds = measure(listener.calculate_next_time, get_sample_times(timetable))
+    check(baselines, f"calculate_next_time[{name}]", seconds)
+
+
+async def test_update_timetable(hass, config, sized, baselines, aioclient_mock, mocker):
+    """Benchmark a refresh ingesting a page that changes the last day."""
+    (name, timetable) = sized
+    lupt = set_up_mock(hass, timetable, config)
+    mocker.patch("custom_components.lupt.event.async_track_point_in_utc_time")
+    mocker.patch("custom_components.lupt.snapshot.write_snapshot")
+    mocker.patch("custom_components.lupt.ingest.lupt_cache.cache_timetable")
+
+    rows = generate_rows(SIZES[name])
+    pages = [
+        build_html([*rows[:-1], {**rows[-1], "Fajr Jamā'ah": f"6:{i:02}"}])
+        for i in range(REPEAT)
+    ]
+
+    timings = []
+    utc_now = get_sample_times(timetable)[0]
+    with patch("homeassistant.util.dt.utcnow", return_value=utc_now):
+        for page in pages:
+            aioclient_mock.clear_requests()
+            aioclient_mock.get(URL, content=page)
+            start = time.perf_counter()
+            await lupt.update_timetable()
+            timings.append(time.perf_counter() - start)
+    await hass.async_block_till_done()
+    lupt.detach()
+
+    assert lupt.get_fetch_stats()["fetch_failures"] == 0
+    assert lupt.get_cached_version() == 1 + REPEAT
+    check(baselines, f"update_timetable[{name}]", statistics.median(timings))
@@ -0,0 +1,64 @@
+"""Test fetch backoff and circuit breaking."""
+from datetime import timedelta
+
+from custom_components.lupt.breaker import (
+    BREAKER_COOLDOWN,
+    BREAKER_THRESHOLD,
+    RETRY_BASE,
+    RETRY_MAX,
+    STATE_CLOSED,
+    STATE_HALF_OPEN,
+    STATE_OPEN,
+    FetchBreaker,
+)
+
+from .test_init import create_utc_datetime
+
+
+def test_backoff():
+    """Test retries back off exponentially up to the maximum."""
+    breaker = FetchBreaker()
+    now = create_utc_datetime(2021, 10, 2, 10, 0)
+
+    breaker.record_failure(now, ValueError())
+    assert breaker.get_retry_time(now) == now + RETRY_BASE
+    breaker.record_failure(now, ValueError())
+    assert breaker.get_retry_time(now) == now + RETRY_BASE * 2
+
+    breaker.consecutive_failures = 20
+    assert breaker.get_retry_time(now) == now + RETRY_MAX
+
+    breaker.record_success(now)
+    assert breaker.consecutive_failures == 0
+    assert breaker.get_stats(now)["fetch_last_success"] == now.isoformat()
+
+
+def test_circuit_breaker():
+    """Test the circuit opens, lets one trial through and closes again."""
+    breaker = FetchBreaker()
+    now = create_utc_datetime(2021, 10, 2, 10, 0)
+
+    for _ in range(BREAKER_THRESHOLD):
+        assert breaker.allow(now)
+        breaker.record_failure(now, ValueError("down"))
+
+    assert breaker.get_state(now) == STATE_OPEN
+    assert not breaker.allow(now)
+    assert breaker.get_retry_time(now) == now + BREAKER_COOLDOWN
+
+    later = now + BREAKER_COOLDOWN
+    assert breaker.get_state(later) == STATE_HALF_OPEN
+    assert breaker.allow(later)
+    breaker.record_failure(later, ValueError("down"))
+    assert breaker.get_state(later + timedelta(minutes=1)) == STATE_OPEN
+
+    trial = later + BREAKER_COOLDOWN
+    assert breaker.allow(trial)
+    breaker.record_success(trial)
+    assert breaker.get_state(trial) == STATE_CLOSED
+
+    stats = breaker.get_stats(trial)
+    assert stats["fetch_attempts"] == BREAKER_THRESHOLD + 2
+    assert stats["fetch_failures"] == BREAKER_THRESHOLD + 1
+    assert stats["fetch_rejected"] == 1
+    assert stats["fetch_last_error"] == "ValueError('down')"
@@ -4,7 +4,7 @@ import pytest
 from pytest_homeassistant_custom_component.common import MockConfigEntry
 
 from custom_components.lupt import config_flow
-from custom_components.lupt.const import CONFIG_SCHEMA, DOMAIN, URL
+from custom_components.lupt.const import CONFIG_SCHEMA, DOMAIN, PREFETCH_KEY, URL
 
 
 async def test_flow_user_init(hass):
@@ -44,6 +44,23 @@ async def test_invalid_url(hass, config_flow_bad_remote):
         await config_flow.validate_url(hass, "duff-url", None)
 
 
+async def test_invalid_rows(hass, mocker):
+    """Test a probed page whose rows don't build is dropped."""
+    prefetch = hass.loop.create_future()
+    mocker.patch(
+        "custom_components.lupt.config_flow.remote." + "async_probe_url",
+        return_value=([], prefetch),
+    )
+    mocker.patch(
+        "custom_components.lupt.config_flow.timetable." + "build_timetable",
+        side_effect=ValueError,
+    )
+    with pytest.raises(config_flow.UrlValueError):
+        await config_flow.validate_url(hass, DEFAULT_URL, None)
+    assert prefetch.cancelled()
+    assert DEFAULT_URL not in hass.data.get(DOMAIN, {}).get(PREFETCH_KEY, {})
+
+
 async def test_bad_url(hass):
     """Test errors produced when url is invalid."""
     _result = await hass.config_entries.flow.async_init(
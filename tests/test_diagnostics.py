@@ -0,0 +1,40 @@
+"""Test lupt diagnostics."""
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.lupt.const import DOMAIN
+from custom_components.lupt.diagnostics import async_get_config_entry_diagnostics
+
+from .test_init import create_utc_datetime
+
+
+async def test_diagnostics(hass, lupt_mock, config, mocker):
+    """Test diagnostics cover the timetable, fetches and performance."""
+    mocker.patch(
+        "custom_components.lupt.dt_util.utcnow",
+        return_value=create_utc_datetime(2021, 10, 2, 12, 0),
+    )
+    lupt_mock.set_cached_timetable(lupt_mock.get_cached_timetable())
+    lupt_mock.publish_timetable()
+    await hass.async_block_till_done()
+    entry = MockConfigEntry(domain=DOMAIN, data=config)
+    hass.data[DOMAIN][entry.entry_id] = lupt_mock
+
+    diagnostics = await async_get_config_entry_diagnostics(hass, entry)
+    lupt_mock.detach()
+
+    assert diagnostics["config"] == config
+    timetable = diagnostics["timetable"]
+    assert timetable["num_dates"] == 3
+    assert timetable["num_events"] == 36
+    assert timetable["min_date"] == "2021-10-01"
+    assert timetable["timetable_bytes"] > 0
+    assert diagnostics["fetch"]["fetch_attempts"] == 0
+
+    performance = diagnostics["performance"]
+    assert performance["index_bytes"] == (12 + 2) * 3 * 4
+    assert performance["index_build_ms"] > 0
+    assert performance["fetch_latency_ms"] is None
+    assert performance["active_timers"] == 1
+    assert performance["last_refresh"] is None
+    assert performance["suppressed_writes"] == lupt_mock.suppressed_writes
+    assert performance["callback_latency"]["update_prayer_time"]["count"] > 0
@@ -0,0 +1,176 @@
+"""Test the timetable index."""
+import copy
+from datetime import date, timedelta
+
+from london_unified_prayer_times import constants as lupt_constants, query as lupt_query
+import pytest
+
+from custom_components.lupt.index import (
+    TimetableIndex,
+    get_changed_dates,
+    prune_timetable,
+)
+
+from .test_init import create_utc_datetime
+
+tk = lupt_constants.TimetableKeys
+
+TIMES = ["Fajr Begins", "Sunrise", "Zuhr Begins", "Asr Mithl 1", "Maghrib Begins"]
+
+
+def test_index_size(three_day_timetable):
+    """Test every event is indexed."""
+    index = TimetableIndex(three_day_timetable)
+    assert len(index) == 36
+    assert index.num_dates == 3
+    assert index.nbytes == 3 * 14 * 4
+    for column in index.columns.values():
+        assert list(column) == sorted(column)
+
+
+def test_index_matches_query(three_day_timetable):
+    """Test the index agrees with the library query."""
+    index = TimetableIndex(three_day_timetable)
+    dt = create_utc_datetime(2021, 10, 1, 12, 0)
+    end = create_utc_datetime(2021, 10, 3, 11, 30)
+    while dt < end:
+        for times in (TIMES, ["Zuhr Begins"]):
+            expected = lupt_query.get_now_and_next(three_day_timetable, times, dt)
+            assert index.get_now_and_next(times, dt) == expected
+        dt = dt + timedelta(minutes=7)
+
+
+def test_index_out_of_range(three_day_timetable):
+    """Test queries outside the timetable."""
+    index = TimetableIndex(three_day_timetable)
+    with pytest.raises(KeyError):
+        index.get_now_and_next(TIMES, create_utc_datetime(2021, 9, 30, 12, 0))
+    with pytest.raises(KeyError):
+        index.get_now_and_next(TIMES, create_utc_datetime(2021, 10, 4, 12, 0))
+
+
+def test_index_islamic_date(three_day_timetable):
+    """Test Islamic dates are unpacked."""
+    index = TimetableIndex(three_day_timetable)
+    for dt in three_day_timetable[tk.DATES]:
+        expected = lupt_query.get_islamic_date(three_day_timetable, dt)
+        assert index.get_islamic_date(dt) == expected
+    with pytest.raises(KeyError):
+        index.get_islamic_date(date(2021, 10, 4))
+
+
+def test_index_diff(three_day_timetable):
+    """Test changed cells are listed with old and new times."""
+    old_index = TimetableIndex(three_day_timetable)
+    changed = copy.deepcopy(three_day_timetable)
+    zuhr = create_utc_datetime(2021, 10, 2, 12, 0)
+    changed[tk.DATES][date(2021, 10, 2)][tk.TIMES]["Zuhr Begins"] = zuhr
+    del changed[tk.DATES][date(2021, 10, 1)]
+    new_index = TimetableIndex(changed)
+
+    assert new_index.diff(old_index) == {
+        "Zuhr Begins": [
+            (date(2021, 10, 1), old_index.columns["Zuhr Begins"][0], None),
+            (
+                date(2021, 10, 2),
+                old_index.columns["Zuhr Begins"][1],
+                int(zuhr.timestamp()) // 60,
+            ),
+        ],
+        **{
+            label: [(date(2021, 10, 1), column[0], None)]
+            for label, column in old_index.columns.items()
+            if label != "Zuhr Begins"
+        },
+    }
+    assert new_index.diff(new_index) == {}
+
+
+def test_index_updated(three_day_timetable):
+    """Test re-indexing changed dates matches a full rebuild."""
+    old_index = TimetableIndex(three_day_timetable)
+    changed = dict(three_day_timetable)
+    changed[tk.DATES] = dict(three_day_timetable[tk.DATES])
+    day = copy.deepcopy(changed[tk.DATES][date(2021, 10, 2)])
+    day[tk.ISLAMIC_DATE] = (1443, "Rabi al-Awwal", 1)
+    day[tk.TIMES]["Sunrise"] = create_utc_datetime(2021, 10, 2, 6, 10)
+    changed[tk.DATES][date(2021, 10, 2)] = day
+    later = copy.deepcopy(changed[tk.DATES][date(2021, 10, 3)])
+    later[tk.TIMES] = {
+        label: time + timedelta(days=1) for label, time in later[tk.TIMES].items()
+    }
+    changed[tk.DATES][date(2021, 10, 4)] = later
+
+    assert get_changed_dates(three_day_timetable, changed) == (
+        [date(2021, 10, 2), date(2021, 10, 4)],
+        [],
+    )
+    index = old_index.updated(changed, [date(2021, 10, 2), date(2021, 10, 4)], [])
+    rebuilt = TimetableIndex(changed)
+    assert index.dates == rebuilt.dates
+    assert index.columns == rebuilt.columns
+    assert index.get_islamic_date(date(2021, 10, 2)) == (1443, "Rabi al-Awwal", 1)
+    assert index.get_islamic_date(date(2021, 10, 4)) == (1443, "Safar", 26)
+    assert old_index.num_dates == 3
+    assert old_index.columns["Sunrise"][1] != index.columns["Sunrise"][1]
+
+    del changed[tk.DATES][date(2021, 10, 1)]
+    (dates, removed) = get_changed_dates(three_day_timetable, changed)
+    assert removed == [date(2021, 10, 1)]
+    index = old_index.updated(changed, dates, removed)
+    assert index.dates == TimetableIndex(changed).dates
+
+
+def test_index_bytes(three_day_timetable):
+    """Test the index survives a round trip through its columnar buffer."""
+    index = TimetableIndex(three_day_timetable)
+    buffer = index.to_bytes()
+    loaded = TimetableIndex.from_bytes(buffer)
+
+    assert len(buffer) - index.nbytes < 200
+    assert loaded.dates == index.dates
+    assert loaded.islamic_dates == index.islamic_dates
+    assert loaded.months == index.months
+    assert loaded.columns == index.columns
+    assert list(loaded.columns) == list(index.columns)
+    assert loaded.last_updated == index.last_updated.replace(
+        microsecond=loaded.last_updated.microsecond
+    )
+
+    with pytest.raises(ValueError):
+        TimetableIndex.from_bytes(buffer[:-1])
+    with pytest.raises(ValueError):
+        TimetableIndex.from_bytes(b"XXXX" + buffer[4:])
+
+
+def test_index_to_timetable(three_day_timetable):
+    """Test a timetable rebuilt from the index matches the original."""
+    config = three_day_timetable[tk.SETUP][tk.CONFIG]
+    rebuilt = TimetableIndex(three_day_timetable).to_timetable("test", "url", config)
+
+    assert rebuilt[tk.DATES] == three_day_timetable[tk.DATES]
+    for day in rebuilt[tk.DATES].values():
+        times = list(day[tk.TIMES].values())
+        assert times == sorted(times)
+    for key in [tk.NUMBER_OF_DATES, tk.MIN_DATE, tk.MAX_DATE, tk.ISLAMIC_MONTHS]:
+        assert rebuilt[tk.STATS][key] == three_day_timetable[tk.STATS][key]
+
+
+def test_prune_timetable(three_day_timetable):
+    """Test days before the window are split off, but never all of them."""
+    (pruned, evicted) = prune_timetable(three_day_timetable, date(2021, 10, 2))
+    assert list(evicted) == [date(2021, 10, 1)]
+    assert list(pruned[tk.DATES]) == [date(2021, 10, 2), date(2021, 10, 3)]
+    assert pruned[tk.STATS][tk.NUMBER_OF_DATES] == 2
+    assert pruned[tk.STATS][tk.MIN_DATE] == date(2021, 10, 2)
+    assert three_day_timetable[tk.STATS][tk.NUMBER_OF_DATES] == 3
+    day = three_day_timetable[tk.DATES][date(2021, 10, 2)]
+    assert pruned[tk.DATES][date(2021, 10, 2)] is day
+
+    assert prune_timetable(three_day_timetable, date(2021, 10, 1))[1] == {}
+    assert prune_timetable(three_day_timetable, date(2021, 10, 9))[1] == {}
+
+    index = TimetableIndex(three_day_timetable)
+    updated = index.updated(pruned, [], list(evicted))
+    assert updated.dates == TimetableIndex(pruned).dates
+    assert updated.columns == TimetableIndex(pruned).columns
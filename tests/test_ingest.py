@@ -0,0 +1,90 @@
+"""Test streaming ingestion of timetable pages."""
+import copy
+from datetime import date
+
+from london_unified_prayer_times import (
+    config as lupt_config,
+    constants as lupt_constants,
+    timetable,
+)
+
+from custom_components.lupt.ingest import ROW_DIGEST, RowParser, TimetableBuilder
+
+from .synthetic import build_html
+
+tk = lupt_constants.TimetableKeys
+
+URL = "http://mock.url.com"
+
+
+def build(rows, previous=None, chunk_size=64, first_date=None):
+    """Help feed a page into a builder in chunks."""
+    config = lupt_config.default_config()
+    builder = TimetableBuilder("test", URL, config, previous, first_date=first_date)
+    html = build_html(rows)
+    for i in range(0, len(html), chunk_size):
+        builder.feed(html[i : i + chunk_size])
+    return builder, builder.finish()
+
+
+def test_row_parser(three_unsorted_days):
+    """Test rows are collected from the right table as the page is fed in."""
+    html = build_html(three_unsorted_days).decode()
+    parser = RowParser("Prayerdata")
+    parser.feed(html[:300])
+    assert len(parser.rows) < 3
+    parser.feed(html[300:])
+    assert parser.rows == three_unsorted_days
+
+    parser = RowParser("missing")
+    parser.feed(html)
+    assert parser.rows == []
+
+
+def test_builder_matches_library(three_unsorted_days):
+    """Test streamed days match the library's build of the same rows."""
+    expected = timetable.build_timetable(
+        "test", URL, lupt_config.default_config(), three_unsorted_days
+    )
+    (_, built) = build(three_unsorted_days)
+
+    for day in built[tk.DATES].values():
+        assert day.pop(ROW_DIGEST)
+    assert built[tk.DATES] == expected[tk.DATES]
+    assert list(built[tk.DATES]) == sorted(expected[tk.DATES])
+    for key in [tk.NUMBER_OF_DATES, tk.MIN_DATE, tk.MAX_DATE, tk.ISLAMIC_MONTHS]:
+        assert built[tk.STATS][key] == expected[tk.STATS][key]
+
+
+def test_builder_reuses_unchanged_rows(three_unsorted_days):
+    """Test only new or changed rows are built and missing ones dropped."""
+    (_, previous) = build(three_unsorted_days)
+    old_days = previous[tk.DATES]
+
+    rows = copy.deepcopy(three_unsorted_days)
+    rows[0]["Islamic day"] = "27"
+    rows[2] = {**rows[1], "Gregorian date": "04/10/2021", "Islamic day": "28"}
+    (builder, merged) = build(rows, previous)
+
+    days = merged[tk.DATES]
+    assert builder.reused == 1
+    assert list(days) == [date(2021, 10, 2), date(2021, 10, 3), date(2021, 10, 4)]
+    assert days[date(2021, 10, 2)] is old_days[date(2021, 10, 2)]
+    assert days[date(2021, 10, 3)] is not old_days[date(2021, 10, 3)]
+    assert days[date(2021, 10, 3)][tk.ISLAMIC_DATE] == (1443, "Safar", 27)
+    assert days[date(2021, 10, 4)][tk.ISLAMIC_DATE] == (1443, "Safar", 28)
+    assert merged[tk.STATS][tk.NUMBER_OF_DATES] == 3
+    assert merged[tk.STATS][tk.MIN_DATE] == date(2021, 10, 2)
+    assert merged[tk.STATS][tk.MAX_DATE] == date(2021, 10, 4)
+    assert merged[tk.STATS][tk.ISLAMIC_MONTHS] == ["Safar"]
+
+
+def test_builder_skips_old_rows(three_unsorted_days, mocker):
+    """Test rows before the first date are skipped without being built."""
+    build_day = mocker.spy(TimetableBuilder, "build_day")
+    (builder, built) = build(three_unsorted_days, first_date=date(2021, 10, 2))
+
+    assert list(built[tk.DATES]) == [date(2021, 10, 2), date(2021, 10, 3)]
+    assert builder.skipped == 1
+    assert build_day.call_count == 2
+    assert built[tk.STATS][tk.MIN_DATE] == date(2021, 10, 2)
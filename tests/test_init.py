@@ -1,17 +1,31 @@
 """Test component setup."""
+import asyncio
 import datetime
 from datetime import timedelta
 from unittest.mock import patch
 
+from homeassistant.config_entries import ConfigEntryState
 import homeassistant.core as ha
 from homeassistant.setup import async_setup_component
 import homeassistant.util.dt as dt_util
 from london_unified_prayer_times import query as lupt_query
 from pytest_homeassistant_custom_component.common import MockConfigEntry
 
+from custom_components.lupt import Lupt, snapshot
+from custom_components.lupt.breaker import (
+    BREAKER_COOLDOWN,
+    BREAKER_THRESHOLD,
+    RETRY_BASE,
+)
 from custom_components.lupt.const import (
+    ARCHIVE_HISTORY,
     DOMAIN,
     ENTITY_ID,
+    FETCHED_KEY,
+    LOCAL_TICKET,
+    REFRESH_MAX_DAYS,
+    REFRESH_MIN_DAYS,
+    RETENTION_DAYS,
     STATE_ATTR_ISLAMIC_DATE,
     STATE_ATTR_ISLAMIC_DAY,
     STATE_ATTR_ISLAMIC_MONTH,
@@ -20,7 +34,9 @@ from custom_components.lupt.const import (
     STATE_ATTR_MAX_DATE,
     STATE_ATTR_MIN_DATE,
     STATE_ATTR_NUM_DATES,
+    VALIDATORS_KEY,
 )
+from custom_components.lupt.index import TimetableIndex
 
 DEFAULT_TZ = dt_util.get_time_zone("Europe/London")
 dt_util.set_default_time_zone(DEFAULT_TZ)
@@ -324,8 +340,8 @@ async def test_midnight_refresh(
     assert_attribute(hass, STATE_ATTR_LAST_UPDATED, first_update)
 
     mocker.patch(
-        "custom_components.lupt.lupt_cache." + "init_timetable",
-        return_value=three_day_timetable_later,
+        "custom_components.lupt.remote." + "async_init_timetable",
+        return_value=(three_day_timetable_later, {}),
     )
 
     patched_time = create_local_datetime(2021, 10, 3, 0, 15) + timedelta(seconds=5)
@@ -395,3 +411,362 @@ async def test_async_unload_entry(
         await hass.async_block_till_done()
 
     assert_state(hass, "Zuhr")
+
+
+async def test_unchanged_refresh(hass, lupt_mock, mocker):
+    """Test an unchanged remote skips the rebuild."""
+    validators = {"etag": '"abc"', "last_modified": None, "digest": "123"}
+    mocker.patch(
+        "custom_components.lupt.remote." + "async_init_timetable",
+        return_value=(None, validators),
+    )
+    lupt_mock.version = lupt_mock.get_cached_version()
+    publish = mocker.patch.object(lupt_mock, "publish_timetable")
+    index = lupt_mock.get_cached_index()
+
+    await lupt_mock.update_timetable()
+    lupt_mock.detach()
+
+    assert not publish.called
+    assert lupt_mock.get_cached_index() is index
+    assert hass.data[DOMAIN][VALIDATORS_KEY] == validators
+
+
+async def test_single_flight_refresh(
+    hass, lupt_mock, three_day_timetable, config, mocker
+):
+    """Test concurrent refreshes share one fetch and commit once."""
+    fetched = asyncio.Event()
+
+    async def slow_fetch(*args):
+        await fetched.wait()
+        return (three_day_timetable, {})
+
+    fetch = mocker.patch(
+        "custom_components.lupt.remote." + "async_init_timetable",
+        side_effect=slow_fetch,
+    )
+    publish = mocker.patch.object(lupt_mock, "publish_timetable")
+    other = Lupt(hass, config)
+    mocker.patch.object(other, "publish_timetable")
+    version = lupt_mock.get_cached_version()
+
+    refreshes = asyncio.gather(lupt_mock.update_timetable(), other.update_timetable())
+    await asyncio.sleep(0)
+    fetched.set()
+    await refreshes
+    lupt_mock.detach()
+    other.detach()
+
+    assert fetch.call_count == 1
+    assert lupt_mock.get_cached_version() == version + 1
+    assert publish.call_count == 1
+    assert other.publish_timetable.call_count == 1
+
+
+def test_stale_commit(lupt_mock, three_day_timetable):
+    """Test a fetch started before the committed one is dropped."""
+    version = lupt_mock.get_cached_version()
+    lupt_mock.commit_timetable(2, three_day_timetable, {})
+    lupt_mock.commit_timetable(1, three_day_timetable, {})
+    lupt_mock.commit_timetable(2, three_day_timetable, {})
+    lupt_mock.commit_timetable(0, three_day_timetable, {})
+    assert lupt_mock.get_cached_version() == version + 1
+
+
+async def test_startup_from_local(
+    hass, lupt_mock, three_day_timetable, start_dt, mocker
+):
+    """Test startup publishes the local copy before the remote refresh."""
+    mocker.patch(
+        "custom_components.lupt.lupt_cache." + "load_cached_timetable",
+        return_value=three_day_timetable,
+    )
+    mocker.patch("custom_components.lupt.dt_util.utcnow", return_value=start_dt)
+    update = mocker.patch.object(lupt_mock, "update_timetable")
+    hass.data[DOMAIN].clear()
+
+    await lupt_mock.async_init()
+    await hass.async_block_till_done()
+    lupt_mock.detach()
+    assert_state(hass, "Zuhr")
+    assert update.call_count == 1
+
+
+async def test_startup_without_local(hass, lupt_mock, start_dt, mocker):
+    """Test startup waits for the remote without a usable local copy."""
+    mocker.patch(
+        "custom_components.lupt.lupt_cache." + "load_cached_timetable",
+        side_effect=FileNotFoundError,
+    )
+    mocker.patch("custom_components.lupt.dt_util.utcnow", return_value=start_dt)
+    update = mocker.patch.object(lupt_mock, "update_timetable")
+    hass.data[DOMAIN].clear()
+
+    await lupt_mock.async_init()
+    lupt_mock.detach()
+    assert update.call_count == 1
+    assert lupt_mock.refresh_task is None
+
+
+def test_build_day_plan(hass, lupt_mock):
+    """Test a day plan holds every state transition in order."""
+    hass.config.set_time_zone("Europe/London")
+    plan = lupt_mock.build_day_plan(create_utc_datetime(2021, 10, 2, 3, 0))
+    states = [(step[0], step[1]) for step in plan.steps if step[1]]
+    assert states[:8] == [
+        (create_utc_datetime(2021, 10, 2, 3, 0), "Ishā"),
+        (create_utc_datetime(2021, 10, 2, 4, 32), "Fajr"),
+        (create_utc_datetime(2021, 10, 2, 6, 0), "Duha"),
+        (create_utc_datetime(2021, 10, 2, 11, 45), "Zawaal"),
+        (create_utc_datetime(2021, 10, 2, 11, 55), "Zuhr"),
+        (create_utc_datetime(2021, 10, 2, 14, 54), "Asr"),
+        (create_utc_datetime(2021, 10, 2, 17, 39), "Maghrib"),
+        (create_utc_datetime(2021, 10, 2, 18, 57), "Ishā"),
+    ]
+    assert plan.end == create_utc_datetime(2021, 10, 2, 23, 0)
+    assert plan.steps[0][2] == {
+        "next_ishā": create_utc_datetime(2021, 10, 2, 18, 57).isoformat()
+    }
+    idates = [step[2] for step in plan.steps if step[1] is None]
+    assert idates[0][STATE_ATTR_ISLAMIC_DATE] == "25 Safar 1443"
+
+
+async def test_update_prayer_time_uses_plan(hass, lupt_mock, mocker):
+    """Test transitions within a day do not query the timetable."""
+    utcnow = mocker.patch(
+        "custom_components.lupt.dt_util.utcnow",
+        return_value=create_utc_datetime(2021, 10, 2, 12, 0),
+    )
+    lupt_mock.update_prayer_time()
+    await hass.async_block_till_done()
+    assert_state(hass, "Zuhr")
+
+    query = mocker.spy(lupt_mock.get_cached_index(), "get_now_and_next")
+    utcnow.return_value = create_utc_datetime(2021, 10, 2, 14, 54)
+    lupt_mock.unsub_prayer_time()
+    lupt_mock.update_prayer_time()
+    lupt_mock.unsub_prayer_time()
+    await hass.async_block_till_done()
+
+    assert_state(hass, "Asr")
+    assert not query.called
+
+
+async def test_coalesced_writes(hass, lupt_mock, start_dt, mocker):
+    """Test writes are batched per tick and skipped when unchanged."""
+    mocker.patch("custom_components.lupt.dt_util.utcnow", return_value=start_dt)
+    write = mocker.patch.object(lupt_mock, "async_write_ha_state")
+
+    lupt_mock.set_cached_timetable(lupt_mock.get_cached_timetable())
+    lupt_mock.publish_timetable()
+    lupt_mock.unsub_prayer_time()
+    await hass.async_block_till_done()
+    assert write.call_count == 1
+    assert lupt_mock.suppressed_writes == 1
+
+    lupt_mock.update_prayer_time()
+    lupt_mock.unsub_prayer_time()
+    await hass.async_block_till_done()
+    assert write.call_count == 1
+    assert lupt_mock.suppressed_writes == 2
+
+
+async def test_refresh_follows_coverage(hass, lupt_mock, config):
+    """Test the next refresh follows coverage and the last fetch."""
+    hass.config.set_time_zone("Europe/London")
+    now = create_utc_datetime(2021, 10, 2, 10, 0)
+    hass.data[DOMAIN][FETCHED_KEY] = now
+    assert lupt_mock.get_next_refresh_time(now) == create_utc_datetime(
+        2021, 10, 2, 23, 15
+    )
+
+    config = {**config, REFRESH_MIN_DAYS: 5, REFRESH_MAX_DAYS: 2}
+    other = Lupt(hass, config)
+    assert other.refresh_max_days == 5
+    assert other.get_next_refresh_time(now) == create_utc_datetime(2021, 10, 6, 23, 15)
+
+
+async def test_failed_refresh_retries(hass, lupt_mock, mocker):
+    """Test a failed refresh keeps the cached copy and retries with backoff."""
+    fetch = mocker.patch(
+        "custom_components.lupt.remote." + "async_init_timetable",
+        side_effect=ValueError("down"),
+    )
+    track = mocker.patch("custom_components.lupt.event.async_track_point_in_utc_time")
+    index = lupt_mock.get_cached_index()
+    utc_now = create_utc_datetime(2021, 10, 2, 10, 0)
+
+    with patch("homeassistant.util.dt.utcnow", return_value=utc_now):
+        for _ in range(BREAKER_THRESHOLD + 1):
+            await lupt_mock.update_timetable()
+        stats = lupt_mock.get_fetch_stats()
+
+    retries = [
+        args[2]
+        for (args, _) in track.call_args_list
+        if args[1] == lupt_mock.update_timetable
+    ]
+    assert lupt_mock.get_cached_index() is index
+    assert fetch.call_count == BREAKER_THRESHOLD
+    assert retries[0] == utc_now + RETRY_BASE
+    assert retries[1] == utc_now + RETRY_BASE * 2
+    assert retries[-1] == utc_now + BREAKER_COOLDOWN
+    assert stats["fetch_rejected"] == 1
+    assert stats["fetch_circuit"] == "open"
+
+
+async def test_failed_startup_retries(hass, config, start_dt, mocker):
+    """Test setup is retried when neither the remote nor a local copy loads."""
+    mocker.patch(
+        "custom_components.lupt.remote." + "async_init_timetable",
+        side_effect=ValueError("down"),
+    )
+    mocker.patch(
+        "custom_components.lupt.lupt_cache." + "load_cached_timetable",
+        side_effect=FileNotFoundError,
+    )
+    mocker.patch("custom_components.lupt.dt_util.utcnow", return_value=start_dt)
+    track = mocker.patch("custom_components.lupt.event.async_track_point_in_utc_time")
+    hass.data.setdefault(DOMAIN, {})
+
+    lupt = Lupt(hass, config)
+    await lupt.update_timetable()
+    assert not lupt.has_cached_timetable()
+    assert track.call_args[0][2] == start_dt + RETRY_BASE
+
+    config_entry = MockConfigEntry(domain=DOMAIN, data=config)
+    config_entry.add_to_hass(hass)
+    assert not await hass.config_entries.async_setup(config_entry.entry_id)
+    assert config_entry.state is ConfigEntryState.SETUP_RETRY
+    assert track.return_value.called
+
+
+async def test_pool_commits_index(
+    hass, lupt_mock, three_day_timetable, start_dt, mocker
+):
+    """Test an index built in the pool is cached as it is."""
+    index = TimetableIndex(three_day_timetable)
+    mocker.patch(
+        "custom_components.lupt.remote." + "async_init_timetable",
+        return_value=(index, {}),
+    )
+    mocker.patch("custom_components.lupt.dt_util.utcnow", return_value=start_dt)
+    diff = mocker.spy(TimetableIndex, "diff")
+    version = lupt_mock.get_cached_version()
+
+    await lupt_mock.update_timetable()
+    lupt_mock.detach()
+
+    assert lupt_mock.get_cached_index() is index
+    assert lupt_mock.get_cached_timetable() is None
+    assert lupt_mock.get_cached_version() == version + 1
+    assert diff.spy_return == {}
+
+
+async def test_startup_from_snapshot(
+    hass, lupt_mock, three_day_timetable, start_dt, mocker
+):
+    """Test a refresh writes a snapshot that the next startup opens."""
+    validators = {"etag": '"abc"', "last_modified": None, "digest": "123"}
+    mocker.patch(
+        "custom_components.lupt.remote." + "async_init_timetable",
+        return_value=(three_day_timetable, validators),
+    )
+    load = mocker.patch(
+        "custom_components.lupt.lupt_cache." + "load_cached_timetable",
+        side_effect=FileNotFoundError,
+    )
+    mocker.patch("custom_components.lupt.dt_util.utcnow", return_value=start_dt)
+    await lupt_mock.update_timetable()
+    lupt_mock.detach()
+
+    hass.data[DOMAIN].clear()
+    update = mocker.patch.object(lupt_mock, "update_timetable")
+    await lupt_mock.async_init()
+    await hass.async_block_till_done()
+    lupt_mock.detach()
+
+    assert not load.called
+    assert lupt_mock.get_cached_timetable() is None
+    assert isinstance(lupt_mock.get_cached_index().dates, memoryview)
+    assert hass.data[DOMAIN][VALIDATORS_KEY] == validators
+    assert_state(hass, "Zuhr")
+    assert update.call_count == 1
+
+
+async def test_commit_prunes_history(
+    hass, lupt_mock, three_day_timetable, config, mocker
+):
+    """Test committed timetables keep only the retention window."""
+    archive = mocker.patch("custom_components.lupt.snapshot.archive_days")
+    other = Lupt(hass, {**config, RETENTION_DAYS: 0, ARCHIVE_HISTORY: True})
+    utc_now = create_utc_datetime(2021, 10, 2, 10, 0)
+    with patch("homeassistant.util.dt.utcnow", return_value=utc_now):
+        assert other.commit_timetable(LOCAL_TICKET, three_day_timetable, {})
+        assert other.commit_timetable(LOCAL_TICKET, three_day_timetable, {})
+    await hass.async_block_till_done()
+
+    index = other.get_cached_index()
+    assert index.num_dates == 2
+    assert index.min_date == datetime.date(2021, 10, 2)
+    assert archive.call_count == 1
+    assert list(archive.call_args[0][1]) == [datetime.date(2021, 10, 1)]
+
+
+async def test_unchanged_refresh_prunes_history(
+    hass, lupt_mock, three_day_timetable, config, mocker
+):
+    """Test a refresh that finds the timetable unchanged still prunes it."""
+    archive = mocker.patch("custom_components.lupt.snapshot.archive_days")
+    other = Lupt(hass, {**config, RETENTION_DAYS: 0, ARCHIVE_HISTORY: True})
+    utc_now = create_utc_datetime(2021, 10, 1, 10, 0)
+    with patch("homeassistant.util.dt.utcnow", return_value=utc_now):
+        other.commit_timetable(LOCAL_TICKET, three_day_timetable, {})
+        assert not other.commit_timetable(1, None, {})
+    with patch(
+        "homeassistant.util.dt.utcnow", return_value=utc_now + timedelta(days=1)
+    ):
+        assert other.commit_timetable(2, None, {})
+    await hass.async_block_till_done()
+
+    assert other.get_cached_index().min_date == datetime.date(2021, 10, 2)
+    assert archive.call_count == 1
+    assert list(archive.call_args[0][1]) == [datetime.date(2021, 10, 1)]
+
+
+async def test_snapshot_prunes_history(
+    hass, lupt_mock, three_day_timetable, config, snapshot_path, mocker
+):
+    """Test an opened snapshot keeps only the retention window."""
+    archive = mocker.patch("custom_components.lupt.snapshot.archive_days")
+    snapshot.write_snapshot(snapshot_path, TimetableIndex(three_day_timetable))
+    other = Lupt(hass, {**config, RETENTION_DAYS: 0, ARCHIVE_HISTORY: True})
+    utc_now = create_utc_datetime(2021, 10, 3, 10, 0)
+    with patch("homeassistant.util.dt.utcnow", return_value=utc_now):
+        await other.async_load_local()
+    await hass.async_block_till_done()
+
+    index = other.get_cached_index()
+    assert index.num_dates == 1
+    assert index.min_date == datetime.date(2021, 10, 3)
+    expected = TimetableIndex(three_day_timetable)
+    assert index.get_islamic_date(utc_now.date()) == expected.get_islamic_date(
+        utc_now.date()
+    )
+    assert archive.call_count == 1
+    assert list(archive.call_args[0][1]) == [
+        datetime.date(2021, 10, 1),
+        datetime.date(2021, 10, 2),
+    ]
+
+
+async def test_archive_failure_logged(hass, lupt_mock, config, caplog, mocker):
+    """Test a failure to archive is logged rather than dropped."""
+    mocker.patch(
+        "custom_components.lupt.snapshot.archive_days", side_effect=OSError("full")
+    )
+    await lupt_mock.async_archive(
+        lupt_mock.get_cached_index(), datetime.date(2021, 10, 3)
+    )
+    assert "Unable to archive days before 2021-10-03" in caplog.text
@@ -0,0 +1,147 @@
+"""Load test many lupt triggers against one event loop.
+
+These only run with LUPT_BENCHMARK=1, printing a curve of attach time, memory
+per listener, lag at fire time and unload and detach times against the
+number of triggers (run pytest with -s to see it). The entry is unloaded with
+every trigger still attached, which keeps them for the next setup.
+"""
+from datetime import date, timedelta
+import logging
+import os
+import statistics
+import time
+import tracemalloc
+
+from homeassistant.core import callback
+import pytest
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.lupt import trigger
+from custom_components.lupt.const import DOMAIN
+from custom_components.lupt.scheduler import get_scheduler
+
+from .replay import Replay
+from .synthetic import build_synthetic_timetable
+from .test_init import create_utc_datetime
+
+pytestmark = [
+    pytest.mark.benchmark,
+    pytest.mark.skipif(
+        not os.environ.get("LUPT_BENCHMARK"), reason="set LUPT_BENCHMARK=1 to run"
+    ),
+]
+
+SIZES = [100, 1000, 10000]
+EVENTS = [
+    "Fajr Begins",
+    "Sunrise",
+    "Zuhr Begins",
+    "Asr Mithl 1",
+    "Maghrib Begins",
+    "Ishā Begins",
+]
+OFFSETS = [timedelta(minutes=x) for x in (-15, 0, 5, 20)]
+
+# Per trigger costs may grow this much from the smallest load to the largest
+# before they're taken to be growing faster than linearly.
+SCALING = 10
+
+
+@pytest.fixture(scope="module")
+def curves():
+    """Collect results by number of triggers and print them as curves."""
+    results = {}
+    yield results
+    print("\ntriggers attach_us bytes lag_max_ms lag_mean_ms detach_us unload_ms")
+    for (num_triggers, x) in sorted(results.items()):
+        print(
+            f"{num_triggers:8} {x['attach'] * 1e6:9.1f} {x['memory']:5.0f}"
+            f" {x['lag_max'] * 1e3:10.2f} {x['lag_mean'] * 1e3:11.2f}"
+            f" {x['detach'] * 1e6:9.1f} {x['unload'] * 1e3:9.2f}"
+        )
+
+
+async def attach_triggers(hass, num_triggers, action):
+    """Attach triggers mixing events and offsets, returning their removers."""
+    removers = []
+    for i in range(num_triggers):
+        config = {
+            "platform": DOMAIN,
+            "event": EVENTS[i % len(EVENTS)],
+            "offset": OFFSETS[i // len(EVENTS) % len(OFFSETS)],
+        }
+        removers.append(
+            await trigger.async_attach_trigger(
+                hass, config, action, {"trigger_id": str(i)}
+            )
+        )
+    return removers
+
+
+@pytest.mark.parametrize("num_triggers", SIZES)
+async def test_many_triggers(hass, config, num_triggers, curves, caplog, mocker):
+    """Test a day of many triggers, measuring each stage per trigger."""
+    caplog.set_level(logging.WARNING, logger="custom_components.lupt")
+    hass.config.set_time_zone("Europe/London")
+    start = create_utc_datetime(2022, 1, 1, 0, 0)
+    replay = Replay(hass, start)
+    replay.patch(mocker)
+    mocker.patch(
+        "custom_components.lupt.remote." + "async_init_timetable",
+        return_value=(build_synthetic_timetable(30, date(2021, 12, 29)), {}),
+    )
+    mocker.patch(
+        "custom_components.lupt.lupt_cache." + "load_cached_timetable",
+        side_effect=FileNotFoundError,
+    )
+    entry = MockConfigEntry(domain=DOMAIN, data=config)
+    entry.add_to_hass(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    lags = []
+
+    @callback
+    def action(variables):
+        """Record how long after its timer fired the trigger ran."""
+        lags.append(time.perf_counter() - replay.fire_started)
+
+    tracemalloc.start()
+    removers = await attach_triggers(hass, num_triggers, action)
+    memory = tracemalloc.get_traced_memory()[0] / num_triggers
+    tracemalloc.stop()
+    for remove in removers:
+        remove()
+
+    attach_start = time.perf_counter()
+    removers = await attach_triggers(hass, num_triggers, action)
+    attach = (time.perf_counter() - attach_start) / num_triggers
+
+    await replay.async_run_until(start + timedelta(days=1))
+    assert len(lags) == num_triggers
+
+    scheduler = get_scheduler(hass)
+    unload_start = time.perf_counter()
+    assert await hass.config_entries.async_unload(entry.entry_id)
+    unload = time.perf_counter() - unload_start
+    assert scheduler.num_pending == num_triggers
+    assert scheduler._unsub is None
+
+    detach_start = time.perf_counter()
+    for remove in removers:
+        remove()
+    detach = (time.perf_counter() - detach_start) / num_triggers
+    assert scheduler.num_pending == 0
+
+    curves[num_triggers] = {
+        "attach": attach,
+        "memory": memory,
+        "lag_max": max(lags),
+        "lag_mean": statistics.mean(lags),
+        "detach": detach,
+        "unload": unload,
+    }
+    smallest = curves.get(SIZES[0])
+    if smallest and num_triggers > SIZES[0]:
+        assert attach < smallest["attach"] * SCALING
+        assert detach < smallest["detach"] * SCALING
@@ -0,0 +1,74 @@
+"""Test performance telemetry."""
+from custom_components.lupt import perf
+
+
+class Timed:
+    """Hold hass for a timed method."""
+
+    def __init__(self, hass):
+        """Initialise."""
+        self.hass = hass
+
+    @perf.timed("work")
+    def work(self, fail=False):
+        """Do some work."""
+        if fail:
+            raise ValueError()
+        return "done"
+
+
+def test_histogram():
+    """Test latencies are counted into buckets."""
+    histogram = perf.LatencyHistogram()
+    assert histogram.as_dict()["mean_ms"] is None
+
+    for seconds in [0.00005, 0.0001, 0.002, 0.002, 1]:
+        histogram.record(seconds)
+
+    stats = histogram.as_dict()
+    assert stats["count"] == 5
+    assert stats["max_ms"] == 1000
+    assert stats["mean_ms"] == 200.83
+    assert stats["buckets"]["<=0.1ms"] == 2
+    assert stats["buckets"]["<=5ms"] == 2
+    assert stats["buckets"][">500ms"] == 1
+    assert sum(stats["buckets"].values()) == 5
+
+
+def test_timed(hass):
+    """Test calls are timed, even if they fail."""
+    timed = Timed(hass)
+    assert timed.work() == "done"
+    try:
+        timed.work(fail=True)
+    except ValueError:
+        pass
+
+    stats = perf.get_perf_stats(hass).as_dict()
+    assert stats["callback_latency"]["work"]["count"] == 2
+    assert perf.get_perf_stats(hass) is perf.get_perf_stats(hass)
+
+
+def test_fetch_timer(hass):
+    """Test a fetch's time is split between downloading and building."""
+    timer = perf.FetchTimer()
+    chunks = []
+    feed = timer.wrap(chunks.append)
+    feed(b"abc")
+    feed(b"de")
+    with timer.building():
+        pass
+    timer.record(hass)
+
+    stats = perf.get_perf_stats(hass)
+    assert chunks == [b"abc", b"de"]
+    assert stats.fetch_bytes == 5
+    assert 0 < stats.build_seconds
+    assert 0 < stats.fetch_seconds
+
+
+def test_get_size():
+    """Test shared objects are only counted once."""
+    shared = list(range(100))
+    assert perf.get_size([shared, shared]) < perf.get_size([shared, list(shared)])
+    assert perf.get_size({"a": shared}) > perf.get_size(shared)
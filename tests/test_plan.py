@@ -0,0 +1,20 @@
+"""Test day plans."""
+from custom_components.lupt.plan import DayPlan
+
+from .test_init import create_utc_datetime
+
+
+def test_day_plan():
+    """Test the cursor moves through due steps."""
+    first = create_utc_datetime(2021, 10, 2, 4, 32)
+    second = create_utc_datetime(2021, 10, 2, 6, 0)
+    end = create_utc_datetime(2021, 10, 2, 23, 0)
+    plan = DayPlan([(second, "Duha", {}), (first, "Fajr", {})], end)
+
+    assert plan.next_time == first
+    assert plan.advance(create_utc_datetime(2021, 10, 2, 4, 0)) == []
+    assert plan.advance(second) == [(first, "Fajr", {}), (second, "Duha", {})]
+    assert plan.advance(second) == []
+    assert plan.next_time == end
+    assert not plan.is_finished(second)
+    assert plan.is_finished(end)
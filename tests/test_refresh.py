@@ -0,0 +1,59 @@
+"""Test the timetable refresh policy."""
+from datetime import timedelta
+
+from custom_components.lupt import refresh
+
+from .test_init import create_utc_datetime
+
+
+def test_correction_expected():
+    """Test corrections are expected around the end of an Islamic month."""
+    assert refresh.is_correction_expected(29)
+    assert refresh.is_correction_expected(30)
+    assert refresh.is_correction_expected(1)
+    assert not refresh.is_correction_expected(15)
+
+
+def test_refresh_interval():
+    """Test the interval grows with coverage between the limits."""
+    assert refresh.get_refresh_interval(300, False, 1, 14) == 14
+    assert refresh.get_refresh_interval(300, True, 1, 14) == 1
+    assert refresh.get_refresh_interval(40, False, 1, 14) == 5
+    assert refresh.get_refresh_interval(20, False, 1, 14) == 1
+    assert refresh.get_refresh_interval(31, False, 2, 14) == 2
+
+
+async def test_next_refresh(hass):
+    """Test refreshes land at a quarter past local midnight."""
+    hass.config.set_time_zone("Europe/London")
+    now = create_utc_datetime(2021, 10, 2, 10, 0)
+
+    assert refresh.get_next_refresh(now, now, 1) == create_utc_datetime(
+        2021, 10, 2, 23, 15
+    )
+    assert refresh.get_next_refresh(now, now, 14) == create_utc_datetime(
+        2021, 10, 15, 23, 15
+    )
+    stale = now - timedelta(days=30)
+    assert refresh.get_next_refresh(now, stale, 14) == create_utc_datetime(
+        2021, 10, 2, 23, 15
+    )
+
+
+async def test_jittered_refresh(hass):
+    """Test each instance refreshes at its own stable point in the window."""
+    hass.config.set_time_zone("Europe/London")
+    now = create_utc_datetime(2021, 10, 2, 10, 0)
+    window = timedelta(minutes=60)
+
+    jitters = {refresh.get_jitter(f"entry{i}", 60) for i in range(20)}
+    assert len(jitters) > 1
+    assert all(timedelta() <= jitter < window for jitter in jitters)
+    assert refresh.get_jitter("entry1", 60) == refresh.get_jitter("entry1", 60)
+    assert refresh.get_jitter("entry1", 0) == timedelta()
+    assert refresh.get_jitter(None, 60) == timedelta()
+
+    jitter = refresh.get_jitter("entry1", 60)
+    assert refresh.get_next_refresh(now, now, 1, jitter) == (
+        create_utc_datetime(2021, 10, 2, 23, 15) + jitter
+    )
@@ -0,0 +1,219 @@
+"""Test remote timetable fetching."""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+import hashlib
+import threading
+
+import aiohttp
+import homeassistant.util.dt as dt_util
+from london_unified_prayer_times import (
+    config as lupt_config,
+    constants as lupt_constants,
+)
+import pytest
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
+from pytest_homeassistant_custom_component.test_util.aiohttp import (
+    AiohttpClientMockResponse,
+)
+
+from custom_components.lupt import perf, remote
+from custom_components.lupt.const import DOMAIN, POOL_KEY, PREFETCH_KEY
+from custom_components.lupt.index import TimetableIndex
+from custom_components.lupt.ingest import TimetableBuilder
+
+from .synthetic import build_html
+
+HTML = b"""
+<html><body><section class="prayer-times"><table>
+<thead><tr><th>Gregorian date</th><th>Sunrise</th></tr></thead>
+<tbody>
+<tr><td>01/10/2021</td><td>6:58</td></tr>
+<tr><td>02/10/2021</td><td>7:00</td></tr>
+</tbody>
+</table></section></body></html>
+"""
+
+
+URL = "http://mock.url.com"
+
+tk = lupt_constants.TimetableKeys
+
+
+async def test_stream_html(hass, aioclient_mock):
+    """Test a fresh fetch streams the page and stores validators."""
+    aioclient_mock.get(URL, content=HTML, headers={"ETag": '"abc"'})
+    chunks = []
+    validators = await remote.async_stream_html(
+        hass, URL, {}, lambda charset: chunks.append
+    )
+    assert b"".join(chunks) == HTML
+    assert validators[remote.ETAG] == '"abc"'
+    assert validators[remote.LAST_MODIFIED] is None
+    assert validators[remote.DIGEST] == hashlib.sha256(HTML).hexdigest()
+
+
+async def test_stream_html_conditional(hass, aioclient_mock):
+    """Test validators are sent and a 304 skips the body."""
+    aioclient_mock.get(URL, status=304)
+    validators = {remote.ETAG: '"abc"', remote.LAST_MODIFIED: "yesterday"}
+    chunks = []
+    result = await remote.async_stream_html(
+        hass, URL, validators, lambda charset: chunks.append
+    )
+    headers = aioclient_mock.mock_calls[0][3]
+    assert headers["If-None-Match"] == '"abc"'
+    assert headers["If-Modified-Since"] == "yesterday"
+    assert result is None
+    assert chunks == []
+
+
+async def test_stream_html_error(hass, aioclient_mock):
+    """Test errors are raised."""
+    aioclient_mock.get(URL, status=500)
+    chunks = []
+    with pytest.raises(aiohttp.ClientResponseError):
+        await remote.async_stream_html(hass, URL, {}, lambda charset: chunks.append)
+    assert chunks == []
+
+
+async def test_init_timetable_unchanged(
+    hass, aioclient_mock, three_unsorted_days, mocker
+):
+    """Test pages are parsed off the loop, and not at all when unchanged."""
+    html = build_html(three_unsorted_days)
+    aioclient_mock.get(URL, content=html)
+    cache = mocker.patch("custom_components.lupt.ingest.lupt_cache.cache_timetable")
+    threads = []
+    feed = TimetableBuilder.feed
+
+    def thread_feed(builder, chunk):
+        threads.append(threading.current_thread())
+        feed(builder, chunk)
+
+    mocker.patch.object(TimetableBuilder, "feed", thread_feed)
+    build_day = mocker.spy(TimetableBuilder, "build_day")
+    config = lupt_config.default_config()
+
+    (built, validators) = await remote.async_init_timetable(
+        hass, "test", URL, config, {}
+    )
+    assert len(built[tk.DATES]) == 3
+    assert build_day.call_count == 3
+    assert threads and threading.main_thread() not in threads
+    threads.clear()
+    build_day.reset_mock()
+    cache.reset_mock()
+
+    result = await remote.async_init_timetable(
+        hass, "test", URL, config, validators, built
+    )
+    assert result[0] is None
+    assert result[1][remote.DIGEST] == validators[remote.DIGEST]
+    assert not threads
+    assert not build_day.called
+    assert not cache.called
+
+
+async def test_probe_reused_by_fetch(hass, aioclient_mock):
+    """Test a probe stops after a few rows and the page is fetched only once."""
+    aioclient_mock.get(URL, content=HTML, headers={"ETag": '"abc"'})
+    (rows, prefetch) = await remote.async_probe_url(hass, URL, "prayer-times", 1)
+    assert rows == [{"Gregorian date": "01/10/2021", "Sunrise": "6:58"}]
+    remote.store_prefetch(hass, URL, prefetch)
+
+    chunks = []
+    validators = await remote.async_stream_html(
+        hass, URL, {}, lambda charset: chunks.append
+    )
+    assert b"".join(chunks) == HTML
+    assert validators[remote.ETAG] == '"abc"'
+    assert validators[remote.DIGEST] == hashlib.sha256(HTML).hexdigest()
+    assert aioclient_mock.call_count == 1
+
+    await remote.async_stream_html(hass, URL, {}, lambda charset: chunks.append)
+    assert aioclient_mock.call_count == 2
+
+
+async def test_probe_prefetch_dropped(hass, aioclient_mock):
+    """Test a kept page is replaced by a later probe and expires if unused."""
+    aioclient_mock.get(URL, content=HTML)
+    (_, first) = await remote.async_probe_url(hass, URL, "prayer-times", 1)
+    remote.store_prefetch(hass, URL, first)
+    (_, second) = await remote.async_probe_url(hass, URL, "prayer-times", 1)
+    remote.store_prefetch(hass, URL, second)
+    await hass.async_block_till_done()
+    assert first.cancelled()
+    assert hass.data[DOMAIN][PREFETCH_KEY][URL][0] is second
+
+    async_fire_time_changed(
+        hass, dt_util.utcnow() + timedelta(seconds=remote.PREFETCH_TTL + 1)
+    )
+    await hass.async_block_till_done()
+    assert URL not in hass.data[DOMAIN][PREFETCH_KEY]
+    assert await remote.async_take_prefetch(hass, URL) is None
+
+
+@pytest.mark.parametrize("use_pool", [False, True])
+async def test_init_timetable_charset(
+    hass, aioclient_mock, three_unsorted_days, use_pool, mocker
+):
+    """Test pages are decoded with the charset of the response."""
+    html = build_html(three_unsorted_days).decode().encode("cp1257")
+    aioclient_mock.get(URL, content=html)
+    mocker.patch.object(
+        AiohttpClientMockResponse,
+        "charset",
+        new_callable=mocker.PropertyMock,
+        return_value="cp1257",
+        create=True,
+    )
+    mocker.patch("custom_components.lupt.ingest.lupt_cache.cache_timetable")
+    config = lupt_config.default_config()
+
+    with ThreadPoolExecutor(1) as pool:
+        (built, _) = await remote.async_init_timetable(
+            hass, "test", URL, config, {}, pool=pool if use_pool else None
+        )
+    index = built if use_pool else TimetableIndex(built)
+    assert len(index.columns["Ishā Begins"]) == 3
+
+
+async def test_init_timetable_in_pool(
+    hass, aioclient_mock, three_unsorted_days, mocker
+):
+    """Test a pool builds the page and hands back the index of its timetable."""
+    html = build_html(three_unsorted_days)
+    aioclient_mock.get(URL, content=html)
+    cache = mocker.patch("custom_components.lupt.ingest.lupt_cache.cache_timetable")
+    config = lupt_config.default_config()
+    first_date = date(2021, 10, 2)
+
+    with ThreadPoolExecutor(1) as pool:
+        (built, _) = await remote.async_init_timetable(
+            hass, "test", URL, config, {}, pool=pool, first_date=first_date
+        )
+    assert cache.call_count == 1
+    stats = perf.get_perf_stats(hass)
+    assert stats.fetch_bytes == len(html)
+    assert stats.build_seconds > 0
+    (expected, _) = await remote.async_init_timetable(
+        hass, "test", URL, config, {}, first_date=first_date
+    )
+    assert stats.fetch_bytes == len(html)
+
+    expected = TimetableIndex(expected)
+    assert built.min_date == first_date
+    assert built.dates.tolist() == expected.dates.tolist()
+    assert built.islamic_dates.tolist() == expected.islamic_dates.tolist()
+    assert {k: v.tolist() for k, v in built.columns.items()} == {
+        k: v.tolist() for k, v in expected.columns.items()
+    }
+
+
+async def test_process_pool(hass):
+    """Test the process pool is shared and shut down."""
+    pool = remote.get_process_pool(hass)
+    assert remote.get_process_pool(hass) is pool
+    remote.shutdown_process_pool(hass)
+    assert POOL_KEY not in hass.data[DOMAIN]
+    remote.shutdown_process_pool(hass)
@@ -0,0 +1,86 @@
+"""Replay a year of lupt on a fake clock."""
+from collections import Counter
+from datetime import date, timedelta
+import os
+
+import homeassistant.util.dt as dt_util
+from london_unified_prayer_times import constants as lupt_constants
+
+from custom_components.lupt import Lupt
+from custom_components.lupt.const import DOMAIN
+
+from .replay import Replay
+from .synthetic import build_synthetic_timetable
+from .test_init import create_utc_datetime
+
+tk = lupt_constants.TimetableKeys
+
+LISTENERS = [
+    ("Fajr Begins", timedelta(minutes=-30)),
+    ("Sunrise", timedelta()),
+    ("Maghrib Begins", timedelta(minutes=-10)),
+    ("Ishā Jamā'ah", timedelta(minutes=30)),
+]
+
+
+def shift_day(timetable, day, delta):
+    """Copy a timetable, moving every time on one day."""
+    shifted = dict(timetable)
+    shifted[tk.DATES] = dict(timetable[tk.DATES])
+    old_day = shifted[tk.DATES][day]
+    shifted[tk.DATES][day] = {
+        **old_day,
+        tk.TIMES: {k: v + delta for k, v in old_day[tk.TIMES].items()},
+    }
+    return shifted
+
+
+async def test_replay_year(hass, config, mocker):
+    """Test a year of state changes and triggers, with a change every refresh."""
+    hass.config.set_time_zone("Europe/London")
+    start = create_utc_datetime(2022, 1, 1, 0, 0)
+    end = create_utc_datetime(2023, 1, 1, 0, 0)
+    source = build_synthetic_timetable(400, date(2021, 12, 29))
+    replay = Replay(hass, start)
+    replay.patch(mocker)
+    mocker.patch("custom_components.lupt.snapshot.write_snapshot")
+
+    def fetch(*args, **kwargs):
+        """Serve the timetable with today's times moved on by two minutes."""
+        nonlocal source
+        today = dt_util.as_local(replay.now).date()
+        source = shift_day(source, today, timedelta(minutes=2))
+        return source, {}
+
+    init = mocker.patch(
+        "custom_components.lupt.remote." + "async_init_timetable", side_effect=fetch
+    )
+
+    hass.data.setdefault(DOMAIN, {})
+    lupt = Lupt(hass, config, "replay")
+    lupt.set_cached_timetable(source)
+    for (event, offset) in LISTENERS:
+        replay.attach_listener(event, offset)
+    await lupt.async_init()
+    await hass.async_block_till_done()
+    await replay.async_run_until(end)
+
+    for (event, offset) in LISTENERS:
+        expected = sorted(
+            day[tk.TIMES][event] + offset
+            for day in source[tk.DATES].values()
+            if start < day[tk.TIMES][event] + offset <= end
+        )
+        assert replay.triggers[(event, offset)] == expected
+
+    states = Counter(state for (_, state) in replay.transitions[1:])
+    for state in ["Fajr", "Zuhr", "Asr", "Maghrib", "Ishā"]:
+        assert states[state] == 365
+    assert 26 < init.call_count < 60
+
+    if os.environ.get("LUPT_BENCHMARK"):
+        costs = replay.get_costs()
+        assert sum(costs.values()) / 365 < 0.05, costs
+
+    lupt.detach()
+    assert len(replay) == 1
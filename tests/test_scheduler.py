@@ -0,0 +1,193 @@
+"""Test the shared trigger scheduler."""
+import copy
+from datetime import date, timedelta
+from unittest.mock import patch
+
+from homeassistant.core import HassJob, callback
+from london_unified_prayer_times import constants as lupt_constants
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.lupt import Lupt
+from custom_components.lupt.const import DOMAIN
+from custom_components.lupt.scheduler import get_scheduler
+from custom_components.lupt.trigger import LuptListener
+
+from .test_init import create_utc_datetime
+
+tk = lupt_constants.TimetableKeys
+
+
+def attach_listener(hass, runs, event, offset=timedelta()):
+    """Help attach a listener that records its runs."""
+    listener = LuptListener(
+        hass, HassJob(callback(lambda: runs.append(event))), event, offset
+    )
+    listener.async_attach()
+    return listener
+
+
+async def test_single_timer(hass, lupt_mock, mocker):
+    """Test listeners due at the same time share one timer."""
+    track = mocker.patch(
+        "custom_components.lupt.scheduler.event.async_track_point_in_utc_time"
+    )
+    runs = []
+    utc_now = create_utc_datetime(2021, 10, 2, 5, 0)
+    with patch("homeassistant.util.dt.utcnow", return_value=utc_now):
+        listeners = [attach_listener(hass, runs, "Sunrise") for _ in range(5)]
+
+    assert track.call_count == 1
+    scheduler = get_scheduler(hass)
+    assert len(scheduler) == 5
+    assert scheduler.num_pending == 5
+
+    fire_time = create_utc_datetime(2021, 10, 2, 6, 0)
+    assert track.call_args[0][2] == fire_time
+
+    with patch("homeassistant.util.dt.utcnow", return_value=fire_time):
+        scheduler._handle_timer(fire_time)
+    await hass.async_block_till_done()
+
+    assert runs == ["Sunrise"] * 5
+    assert scheduler.num_pending == 5
+    assert track.call_count == 2
+    assert track.call_args[0][2] == create_utc_datetime(2021, 10, 3, 6, 2)
+
+    for listener in listeners:
+        listener.async_detach()
+        listener.async_detach()
+    assert len(scheduler) == 0
+    assert scheduler.num_pending == 0
+
+
+async def test_earliest_deadline(hass, lupt_mock, mocker):
+    """Test the timer follows the earliest live deadline."""
+    track = mocker.patch(
+        "custom_components.lupt.scheduler.event.async_track_point_in_utc_time"
+    )
+    runs = []
+    utc_now = create_utc_datetime(2021, 10, 2, 5, 0)
+    with patch("homeassistant.util.dt.utcnow", return_value=utc_now):
+        zuhr = attach_listener(hass, runs, "Zuhr Begins")
+        sunrise = attach_listener(hass, runs, "Sunrise")
+
+    assert track.call_args[0][2] == create_utc_datetime(2021, 10, 2, 6, 0)
+
+    sunrise.async_detach()
+    assert track.call_args[0][2] == create_utc_datetime(2021, 10, 2, 11, 55)
+
+    zuhr.async_detach()
+    assert len(get_scheduler(hass)) == 0
+    assert runs == []
+
+
+async def test_timetable_change_reschedules(
+    hass, lupt_mock, three_day_timetable, mocker
+):
+    """Test only listeners whose next event changed are rescheduled."""
+    mocker.patch("custom_components.lupt.scheduler.event.async_track_point_in_utc_time")
+    runs = []
+    utc_now = create_utc_datetime(2021, 10, 2, 5, 0)
+    changed = copy.deepcopy(three_day_timetable)
+    zuhr_time = create_utc_datetime(2021, 10, 2, 12, 0)
+    changed[tk.DATES][date(2021, 10, 2)][tk.TIMES]["Zuhr Begins"] = zuhr_time
+    asr_time = create_utc_datetime(2021, 10, 3, 15, 0)
+    changed[tk.DATES][date(2021, 10, 3)][tk.TIMES]["Asr Mithl 1"] = asr_time
+
+    with patch("homeassistant.util.dt.utcnow", return_value=utc_now):
+        zuhr = attach_listener(hass, runs, "Zuhr Begins")
+        asr = attach_listener(hass, runs, "Asr Mithl 1")
+        sunrise = attach_listener(hass, runs, "Sunrise")
+        for listener in (zuhr, asr, sunrise):
+            mocker.spy(listener, "async_reschedule")
+        lupt_mock.set_cached_timetable(changed)
+
+    assert zuhr.async_reschedule.call_count == 1
+    assert zuhr.next_time == zuhr_time
+    assert asr.async_reschedule.call_count == 0
+    assert sunrise.async_reschedule.call_count == 0
+
+
+async def test_stop(hass, lupt_mock, mocker):
+    """Test a stopped scheduler keeps its listeners and reschedules them on start."""
+    unsub = mocker.Mock()
+    track = mocker.patch(
+        "custom_components.lupt.scheduler.event.async_track_point_in_utc_time",
+        return_value=unsub,
+    )
+    runs = []
+    with patch(
+        "homeassistant.util.dt.utcnow",
+        return_value=create_utc_datetime(2021, 10, 2, 5, 0),
+    ):
+        listener = attach_listener(hass, runs, "Sunrise")
+        scheduler = get_scheduler(hass)
+        scheduler.async_stop()
+    assert unsub.call_count == 1
+
+    with patch(
+        "homeassistant.util.dt.utcnow",
+        return_value=create_utc_datetime(2021, 10, 2, 7, 0),
+    ):
+        scheduler.async_start()
+    assert get_scheduler(hass) is scheduler
+    assert listener.next_time == create_utc_datetime(2021, 10, 3, 6, 2)
+    assert track.call_args[0][2] == listener.next_time
+    assert scheduler.num_pending == 1
+
+    listener.async_detach()
+    assert scheduler.num_pending == 0
+    assert get_scheduler(hass) is scheduler
+
+
+async def test_reload_keeps_triggers(hass, lupt_mock_good_load, config, mocker):
+    """Test a trigger attached before a reload of the entry still fires."""
+    track = mocker.patch(
+        "custom_components.lupt.scheduler.event.async_track_point_in_utc_time"
+    )
+    entry = MockConfigEntry(domain=DOMAIN, data=config)
+    entry.add_to_hass(hass)
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+
+    runs = []
+    listener = attach_listener(hass, runs, "Sunrise")
+    scheduler = get_scheduler(hass)
+    assert await hass.config_entries.async_reload(entry.entry_id)
+    await hass.async_block_till_done()
+
+    assert get_scheduler(hass) is scheduler
+    fire_time = create_utc_datetime(2021, 10, 3, 6, 2)
+    assert listener.next_time == fire_time
+    armed = [
+        args[2]
+        for (args, _) in track.call_args_list
+        if args[1] == scheduler._handle_timer
+    ]
+    assert armed == [fire_time, fire_time]
+    scheduler._handle_timer(fire_time)
+    await hass.async_block_till_done()
+    assert runs == ["Sunrise"]
+
+    listener.async_detach()
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_attach_before_load(hass, three_day_timetable, config, caplog, mocker):
+    """Test listeners attached before any timetable are scheduled by the first."""
+    track = mocker.patch(
+        "custom_components.lupt.scheduler.event.async_track_point_in_utc_time"
+    )
+    hass.data.setdefault(DOMAIN, {})
+    runs = []
+    utc_now = create_utc_datetime(2021, 10, 2, 5, 0)
+    with patch("homeassistant.util.dt.utcnow", return_value=utc_now):
+        listener = attach_listener(hass, runs, "Sunrise")
+        assert listener.next_time is None
+        assert not track.called
+        Lupt(hass, config).set_cached_timetable(three_day_timetable)
+
+    assert "No more" not in caplog.text
+    assert listener.next_time == create_utc_datetime(2021, 10, 2, 6, 0)
+    assert track.call_args[0][2] == listener.next_time
+    listener.async_detach()
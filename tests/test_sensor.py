@@ -0,0 +1,88 @@
+"""Test lupt sensors."""
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.lupt import perf, sensor
+from custom_components.lupt.const import DOMAIN
+
+from .test_init import create_utc_datetime
+
+
+async def set_up_sensors(hass, lupt, config, mocker):
+    """Help create sensors without an entity platform."""
+    entry = MockConfigEntry(domain=DOMAIN, data=config)
+    hass.data[DOMAIN][entry.entry_id] = lupt
+    sensors = []
+    await sensor.async_setup_entry(hass, entry, sensors.extend)
+    for number, entity in enumerate(sensors):
+        entity.hass = hass
+        entity.entity_id = f"sensor.lupt_{number}"
+        mocker.patch.object(entity, "async_write_ha_state")
+        await entity.async_added_to_hass()
+    return {entity.name: entity for entity in sensors}
+
+
+async def test_sensors(hass, lupt_mock, config, mocker):
+    """Test sensor values follow lupt."""
+    utcnow = mocker.patch(
+        "custom_components.lupt.dt_util.utcnow",
+        return_value=create_utc_datetime(2021, 10, 2, 12, 0),
+    )
+    lupt_mock.set_cached_timetable(lupt_mock.get_cached_timetable())
+    lupt_mock.publish_timetable()
+    await hass.async_block_till_done()
+    sensors = await set_up_sensors(hass, lupt_mock, config, mocker)
+
+    assert len(sensors) == 8
+    asr = sensors["London Unified Prayer Times Next Asr"]
+    zuhr = sensors["London Unified Prayer Times Next Zuhr"]
+    idate = sensors["London Unified Prayer Times Islamic Date"]
+    diagnostics = sensors["London Unified Prayer Times Timetable"]
+    assert asr.native_value == create_utc_datetime(2021, 10, 2, 14, 54)
+    assert asr.device_class == "timestamp"
+    assert idate.native_value == "25 Safar 1443"
+    assert idate.extra_state_attributes["islamic_day"] == 25
+    assert diagnostics.extra_state_attributes["num_dates"] == 3
+
+    utcnow.return_value = create_utc_datetime(2021, 10, 2, 14, 54)
+    lupt_mock.unsub_prayer_time()
+    lupt_mock.update_prayer_time()
+    lupt_mock.unsub_prayer_time()
+    await hass.async_block_till_done()
+
+    assert asr.native_value == create_utc_datetime(2021, 10, 3, 14, 53)
+    assert asr.async_write_ha_state.call_count == 1
+    assert zuhr.async_write_ha_state.call_count == 0
+    assert idate.async_write_ha_state.call_count == 0
+    assert diagnostics.async_write_ha_state.call_count == 0
+    assert "suppressed_writes" not in diagnostics.extra_state_attributes
+    assert "fetch_attempts" not in diagnostics.extra_state_attributes
+    assert diagnostics.extra_state_attributes["fetch_circuit"] == "closed"
+
+    lupt_mock.get_breaker().attempts += 1
+    diagnostics.async_update_value()
+    assert diagnostics.async_write_ha_state.call_count == 0
+
+
+async def test_performance_sensor(hass, lupt_mock, config, mocker):
+    """Test the performance sensor is only added when asked for."""
+    sensors = await set_up_sensors(hass, lupt_mock, config, mocker)
+    assert "London Unified Prayer Times Performance" not in sensors
+
+    lupt_mock.performance_sensor = True
+    sensors = await set_up_sensors(hass, lupt_mock, config, mocker)
+    performance = sensors["London Unified Prayer Times Performance"]
+    assert performance.native_value is None
+    assert performance.native_unit_of_measurement == "ms"
+    assert performance.extra_state_attributes["index_bytes"] > 0
+
+    assert "callback_latency" not in performance.extra_state_attributes
+
+    perf.get_perf_stats(hass).record_fetch(0.25, 1000, 0.1)
+    performance.async_update_value()
+    assert performance.native_value == 250
+    assert performance.extra_state_attributes["fetch_bytes"] == 1000
+    assert performance.async_write_ha_state.call_count == 1
+
+    perf.get_perf_stats(hass).record("update_prayer_time", 0.001)
+    performance.async_update_value()
+    assert performance.async_write_ha_state.call_count == 1
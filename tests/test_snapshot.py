@@ -0,0 +1,97 @@
+"""Test memory-mapped timetable snapshots."""
+from datetime import date
+import sys
+
+from london_unified_prayer_times import constants as lupt_constants
+import pytest
+
+from custom_components.lupt import snapshot
+from custom_components.lupt.index import TimetableIndex
+
+from .test_index import TIMES
+from .test_init import create_utc_datetime
+
+tk = lupt_constants.TimetableKeys
+
+
+def test_snapshot_round_trip(three_day_timetable, snapshot_path):
+    """Test a snapshot opens as an index reading from the mapped file."""
+    index = TimetableIndex(three_day_timetable)
+    snapshot.write_snapshot(snapshot_path, index)
+    mapped = snapshot.open_snapshot(snapshot_path)
+
+    if sys.byteorder == "little":
+        assert isinstance(mapped.dates, memoryview)
+        assert all(isinstance(x, memoryview) for x in mapped.columns.values())
+    assert mapped.dates.tolist() == index.dates.tolist()
+    assert mapped.max_date == index.max_date
+    dt = create_utc_datetime(2021, 10, 2, 12, 0)
+    assert mapped.covers(dt)
+    assert mapped.get_now_and_next(TIMES, dt) == index.get_now_and_next(TIMES, dt)
+    assert mapped.get_islamic_date(dt.date()) == index.get_islamic_date(dt.date())
+
+
+def test_snapshot_replaced(three_day_timetable, snapshot_path):
+    """Test writing a snapshot leaves an open one readable."""
+    index = TimetableIndex(three_day_timetable)
+    snapshot.write_snapshot(snapshot_path, index)
+    mapped = snapshot.open_snapshot(snapshot_path)
+    snapshot.write_snapshot(snapshot_path, mapped)
+
+    assert snapshot.open_snapshot(snapshot_path).columns == mapped.columns
+    assert mapped.columns["Sunrise"].tolist() == index.columns["Sunrise"].tolist()
+
+
+def test_snapshot_corrupt(three_day_timetable, snapshot_path):
+    """Test a truncated snapshot is refused."""
+    snapshot.write_snapshot(snapshot_path, TimetableIndex(three_day_timetable))
+    with open(snapshot_path, "r+b") as snapshot_file:
+        snapshot_file.truncate(len(snapshot_file.read()) - 4)
+    with pytest.raises(ValueError):
+        snapshot.open_snapshot(snapshot_path)
+
+
+def test_snapshot_validators(three_day_timetable, snapshot_path):
+    """Test a snapshot keeps the validators of the page it was built from."""
+    index = TimetableIndex(three_day_timetable)
+    validators = {"etag": '"abc"', "last_modified": None, "digest": "123"}
+    snapshot.write_snapshot(snapshot_path, index, validators)
+    (mapped, opened) = snapshot.open_snapshot_with_validators(snapshot_path)
+
+    assert opened == validators
+    assert mapped.dates.tolist() == index.dates.tolist()
+    assert snapshot.open_snapshot_with_validators(snapshot_path)[1] == validators
+
+
+def test_archive_days(three_day_timetable, tmp_path):
+    """Test pruned days are merged into yearly archives."""
+    archive_dir = str(tmp_path / "archive")
+    days = three_day_timetable[tk.DATES]
+    last_updated = three_day_timetable[tk.STATS][tk.LAST_UPDATED]
+    assert snapshot.open_archive(archive_dir, 2021) is None
+
+    snapshot.archive_days(
+        archive_dir, {date(2021, 10, 1): days[date(2021, 10, 1)]}, last_updated
+    )
+    snapshot.archive_days(
+        archive_dir,
+        {x: days[x] for x in [date(2021, 10, 1), date(2021, 10, 2)]},
+        last_updated,
+    )
+
+    archive = snapshot.open_archive(archive_dir, 2021)
+    assert archive.num_dates == 2
+    assert archive.get_islamic_date(date(2021, 10, 2)) == (1443, "Safar", 25)
+    index = TimetableIndex(three_day_timetable)
+    assert archive.columns["Sunrise"].tolist() == index.columns["Sunrise"][:2].tolist()
+
+
+def test_archive_index(three_day_timetable, tmp_path):
+    """Test the days of an index before a date are archived."""
+    archive_dir = str(tmp_path / "archive")
+    index = TimetableIndex(three_day_timetable)
+    snapshot.archive_index(archive_dir, index, date(2021, 10, 3))
+
+    archive = snapshot.open_archive(archive_dir, 2021)
+    assert archive.dates.tolist() == index.dates[:2].tolist()
+    assert archive.columns["Sunrise"].tolist() == index.columns["Sunrise"][:2].tolist()
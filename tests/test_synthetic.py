@@ -0,0 +1,90 @@
+"""Test the synthetic timetable generator."""
+from datetime import date, timedelta
+
+from london_unified_prayer_times import (
+    config as lupt_config,
+    constants as lupt_constants,
+    timetable,
+)
+import pytest
+
+from custom_components.lupt.ingest import ROW_DIGEST, TimetableBuilder
+
+from .synthetic import build_html, build_synthetic_timetable, generate_rows
+
+tk = lupt_constants.TimetableKeys
+
+
+def test_rows_are_deterministic():
+    """Test any range matches the same dates of a longer range."""
+    rows = generate_rows(400)
+    assert generate_rows(400) == rows
+    assert generate_rows(50, date(2022, 6, 1)) == rows[243:293]
+    assert rows[0]["Islamic day"] == "24"
+    assert rows[0]["Islamic month"] == "Safar"
+
+    with pytest.raises(ValueError):
+        generate_rows(1, date(2021, 1, 1))
+
+
+def test_islamic_rollovers():
+    """Test months and years roll over, following any forced month lengths."""
+    rows = generate_rows(800)
+    islamic_dates = [
+        (int(x["Islamic year"]), x["Islamic month"], int(x["Islamic day"]))
+        for x in rows
+    ]
+    assert (1443, "Dhu al-Hijjah", 29) in islamic_dates
+    new_year = islamic_dates.index((1444, "Muharram", 1))
+    assert islamic_dates[new_year - 1] == (1443, "Dhu al-Hijjah", 29)
+    assert max(x[2] for x in islamic_dates) == 30
+
+    forced = generate_rows(60, month_lengths=[30, 30, 29])
+    assert forced[6]["Islamic day"] == "30"
+    assert forced[7]["Islamic month"] == "Rabi al-Awwal"
+
+
+def test_dst_transitions():
+    """Test local clock times jump at DST while UTC times move smoothly."""
+    rows = {x["Gregorian date"]: x for x in generate_rows(800)}
+    assert rows["26/03/2022"]["Sunrise"] == "5:39"
+    assert rows["27/03/2022"]["Sunrise"] == "6:36"
+    assert rows["29/10/2022"]["Maghrib Begins"] == "5:35"
+    assert rows["30/10/2022"]["Maghrib Begins"] == "4:33"
+
+    built = build_synthetic_timetable(800)[tk.DATES]
+    for day in [date(2022, 3, 27), date(2022, 10, 30)]:
+        before = built[day - timedelta(days=1)][tk.TIMES]
+        after = built[day][tk.TIMES]
+        for label, time in after.items():
+            assert abs(time - before[label] - timedelta(days=1)) < timedelta(minutes=5)
+
+
+def test_twelve_hour_times():
+    """Test ambiguous 12 hour times all resolve into the right order."""
+    rows = generate_rows(3652)
+    zuhr_hours = {x["Zuhr Begins"].split(":")[0] for x in rows}
+    assert zuhr_hours == {"11", "12", "1"}
+    assert all(int(x["Ishā Jamā'ah"].split(":")[0]) < 12 for x in rows)
+
+    built = build_synthetic_timetable(3652)
+    labels = lupt_config.default_config()[lupt_constants.ConfigKeys.TIMES]
+    assert built[tk.STATS][tk.NUMBER_OF_DATES] == 3652
+    for day in built[tk.DATES].values():
+        assert list(day[tk.TIMES]) == labels
+
+
+def test_streamed_year():
+    """Test a year's page streams into the same days as the library builds."""
+    rows = generate_rows(365)
+    config = lupt_config.default_config()
+    builder = TimetableBuilder("synthetic", "synthetic.py", config)
+    html = build_html(rows)
+    for i in range(0, len(html), 4096):
+        builder.feed(html[i : i + 4096])
+    built = builder.finish()
+
+    expected = timetable.build_timetable("synthetic", "synthetic.py", config, rows)
+    for day in built[tk.DATES].values():
+        assert day.pop(ROW_DIGEST)
+    assert built[tk.DATES] == expected[tk.DATES]